@@ -11,8 +11,8 @@ import os
 
 # Inicializar la app
 app = Flask(__name__)
-from flask_caching import Cache
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})   # 5 min por defecto
+from . import extensions
+cache = extensions.cache
 # Filtros para paginación sin perder filtros
 @app.template_filter('dict_delete')
 def dict_delete(d, key):
@@ -26,6 +26,12 @@ def dict_merge(d, extra):
     d.update(extra)
     return d
 app.config.from_object('config.Config')
+# Cache (backend según CACHE_TYPE en config.py; 5 min por defecto)
+cache.init_app(app)
+if app.config.get('CACHE_TYPE') in ('FileSystemCache', 'filesystem'):
+    app.logger.warning("FileSystemCache no tiene `add` ni `inc` atómicos: use RedisCache con varios workers")
+elif app.config.get('CACHE_TYPE') in ('SimpleCache', 'simple'):
+    app.logger.warning("SimpleCache es local a cada proceso: use RedisCache con varios workers")
 
 # Configurar seguridad
 csrf = CSRFProtect(app)
@@ -42,8 +48,32 @@ login_manager.login_view = 'auth.login'
 
 from . import extensions
 
-extensions.mongo = MongoClient(app.config['MONGO_URI'])
+# Perfil de consultas por petición (Server-Timing, log y detección de N+1)
+from app.services.profiler import command_profiler, init_query_profiler
+listeners = []
+if app.config.get('QUERY_PROFILER'):
+    listeners.append(command_profiler)
+    init_query_profiler(app)
+extensions.mongo = MongoClient(app.config['MONGO_URI'], event_listeners=listeners)
 extensions.db = extensions.mongo[app.config['MONGO_DBNAME']]
+# Las rutas importan `mongo` y `db` desde este módulo
+mongo = extensions.mongo
+db = extensions.db
+from app.services.principals import get_principal
+
+# Índices declarados en app/services/indexes.py (también `flask db ensure-indexes`).
+# En segundo plano: el arranque no espera a MongoDB y un fallo solo se registra.
+if app.config.get('ENSURE_INDEXES') and not app.testing:
+    import threading
+    from app.services.indexes import ensure_indexes
+
+    def _ensure_indexes():
+        try:
+            ensure_indexes()
+        except Exception as e:
+            app.logger.warning("No se pudieron crear los índices: %s", e)
+
+    threading.Thread(target=_ensure_indexes, name='ensure-indexes', daemon=True).start()
 
 # Configurar assets (CSS/JS)
 #assets = Environment(app)
@@ -59,10 +89,10 @@ class User(UserMixin):
     # Agregar propiedad para password_changed
     @property
     def password_changed(self):
-        # Obtener el usuario actual de la base de datos
-        user_data = db.users.find_one({'_id': ObjectId(self.id)})
-        if user_data:
-            return user_data.get('password_changed', False)
+        # Identidad cacheada en el proceso (ver app/services/principals.py)
+        principal = get_principal(self.id)
+        if principal:
+            return principal['password_changed']
         return False        
 
 # Importar rutas
@@ -72,10 +102,10 @@ from app.routes import auth, dashboard, usuarios, vehiculos, ordenes
 # Cargar usuario para login
 @login_manager.user_loader
 def load_user(user_id):
-    user_data = db.users.find_one({'_id': ObjectId(user_id)})
-    if not user_data:
+    principal = get_principal(user_id)
+    if not principal:
         return None
-    return User(user_id, user_data.get('role', 'cliente'), user_data.get('name', 'Usuario'))
+    return User(user_id, principal['role'], principal['name'])
 
 # Registrar blueprints
 from app.routes.auth import auth_bp
@@ -90,6 +120,10 @@ app.register_blueprint(usuarios_bp, url_prefix='/usuarios')
 app.register_blueprint(vehiculos_bp, url_prefix='/vehiculos')
 app.register_blueprint(ordenes_bp, url_prefix='/ordenes')
 
+# Comandos CLI (flask db ...)
+from app.commands import db_cli
+app.cli.add_command(db_cli)
+
 # Configurar assets
 #css_bundle = Bundle(
    # 'src/css/*.css',
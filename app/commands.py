@@ -0,0 +1,228 @@
+import click
+from flask.cli import AppGroup
+from pymongo import UpdateOne
+from app import extensions
+from app.services.indexes import ensure_indexes, verify_indexes
+from app.services.orders import TASK_STATUSES, normalize_task_status, derive_order_status
+from app.services.rollups import rebuild_stats
+from app.services.schema import REFERENCE_FIELDS, VALIDATORS, normalize_references, string_reference_filter
+from app.services.search import normalize_plate, name_tokens
+
+# Comandos de mantenimiento de la base de datos: `flask db <comando>`
+db_cli = AppGroup('db', help='Mantenimiento de la base de datos.')
+
+BATCH_SIZE = 500
+
+
+def _flush(collection, ops):
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+@db_cli.command('backfill-plate-keys')
+def backfill_plate_keys():
+    """Calcula `plate_key` en los vehículos que aún no lo tienen."""
+    vehicles = extensions.db.vehicles
+    ops, total = [], 0
+    for v in vehicles.find({'plate_key': {'$exists': False}}, {'plate': 1}):
+        ops.append(UpdateOne({'_id': v['_id']}, {'$set': {'plate_key': normalize_plate(v.get('plate'))}}))
+        if len(ops) >= BATCH_SIZE:
+            total += _flush(vehicles, ops)
+            ops = []
+    total += _flush(vehicles, ops)
+    click.echo(f"✅ plate_key calculado en {total} vehículos")
+
+
+@db_cli.command('backfill-name-tokens')
+@click.option('--all', 'recompute_all', is_flag=True, help='Recalcular también los que ya tienen tokens.')
+def backfill_name_tokens(recompute_all):
+    """Calcula `name_tokens` (nombre sin acentos, por palabras) en los usuarios."""
+    users = extensions.db.users
+    query = {} if recompute_all else {'name_tokens': {'$exists': False}}
+    ops, total = [], 0
+    for u in users.find(query, {'name': 1}):
+        ops.append(UpdateOne({'_id': u['_id']}, {'$set': {'name_tokens': name_tokens(u.get('name'))}}))
+        if len(ops) >= BATCH_SIZE:
+            total += _flush(users, ops)
+            ops = []
+    total += _flush(users, ops)
+    click.echo(f"✅ name_tokens calculado en {total} usuarios")
+
+
+@db_cli.command('backfill-order-technicians')
+def backfill_order_technicians():
+    """Calcula `technician_ids` en todas las órdenes a partir de sus tareas."""
+    orders = extensions.db.service_orders
+    pipeline = [
+        {'$match': {'technician_id': {'$ne': None}}},
+        {'$group': {'_id': '$order_id', 'technician_ids': {'$addToSet': '$technician_id'}}},
+    ]
+    ops, total = [], 0
+    for doc in extensions.db.service_tasks.aggregate(pipeline, allowDiskUse=True):
+        ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'technician_ids': doc['technician_ids']}}))
+        if len(ops) >= BATCH_SIZE:
+            total += _flush(orders, ops)
+            ops = []
+    total += _flush(orders, ops)
+
+    # Órdenes sin tareas
+    empty = orders.update_many({'technician_ids': {'$exists': False}}, {'$set': {'technician_ids': []}})
+    click.echo(f"✅ technician_ids actualizado en {total} órdenes ({empty.modified_count} sin tareas)")
+
+
+@db_cli.command('migrate-order-counters')
+def migrate_order_counters():
+    """Pasa los contadores mensuales antiguos ('month:YYYY-MM') al documento anual."""
+    counters = extensions.db.order_counters
+    moved = 0
+    for doc in counters.find({'_id': {'$regex': '^month:'}}):
+        year, month = doc['year'], doc['month']
+        counters.update_one(
+            {'_id': f'year:{year}'},
+            {'$max': {f'months.{month:02d}': doc.get('monthly_counter', 0)},
+             '$setOnInsert': {'year': year, 'yearly_counter': doc.get('monthly_counter', 0)}},
+            upsert=True
+        )
+        counters.delete_one({'_id': doc['_id']})
+        moved += 1
+    click.echo(f"✅ {moved} contadores mensuales migrados")
+
+
+@db_cli.command('backfill-task-counts')
+def backfill_task_counts():
+    """Recalcula `task_counts` y `status` de todas las órdenes desde sus tareas."""
+    orders = extensions.db.service_orders
+    pipeline = [{'$group': {'_id': {'order_id': '$order_id', 'status': '$status'}, 'count': {'$sum': 1}}}]
+    counts_by_order = {}
+    for row in extensions.db.service_tasks.aggregate(pipeline, allowDiskUse=True):
+        counts = counts_by_order.setdefault(row['_id']['order_id'], {s: 0 for s in TASK_STATUSES})
+        counts[normalize_task_status(row['_id'].get('status'))] += row['count']
+
+    ops, total = [], 0
+    for o in orders.find({}, {'_id': 1}):
+        counts = counts_by_order.get(o['_id'], {s: 0 for s in TASK_STATUSES})
+        ops.append(UpdateOne({'_id': o['_id']},
+                             {'$set': {'task_counts': counts, 'status': derive_order_status(counts)}}))
+        if len(ops) >= BATCH_SIZE:
+            total += _flush(orders, ops)
+            ops = []
+    total += _flush(orders, ops)
+    click.echo(f"✅ task_counts recalculado en {total} órdenes")
+
+
+@db_cli.command('rebuild-daily-stats')
+def rebuild_daily_stats():
+    """
+    Regenera `daily_stats` desde el historial de órdenes y tareas.
+
+    Se construye en una colección temporal que luego reemplaza a la actual;
+    los cambios que lleguen mientras corre el comando no quedan reflejados,
+    así que conviene ejecutarlo con poco tráfico.
+    """
+    total = rebuild_stats()
+    click.echo(f"✅ daily_stats regenerado: {total} documentos")
+
+
+MIGRATION_ID = 'normalize-references'
+
+
+@db_cli.command('normalize-references')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Documentos por lote.')
+@click.option('--restart', is_flag=True, help='Ignorar el progreso guardado y empezar desde el principio.')
+def normalize_references_command(batch_size, restart):
+    """
+    Convierte a ObjectId las referencias guardadas como texto en órdenes,
+    tareas y relaciones de vehículos.
+
+    Recorre cada colección por _id en lotes y guarda el último _id procesado
+    en `migrations`, de modo que si se interrumpe continúa donde quedó.
+    Informa cuántos valores convirtió por campo y cuáles no son ids válidos.
+    """
+    db = extensions.db
+    if restart:
+        db.migrations.delete_one({'_id': MIGRATION_ID})
+    progress = (db.migrations.find_one({'_id': MIGRATION_ID}) or {}).get('last_ids', {})
+
+    for name in REFERENCE_FIELDS:
+        collection = db[name]
+        query = string_reference_filter(name)
+        last_id = progress.get(name)
+        converted, invalid, docs = {}, {}, 0
+        while True:
+            batch_query = dict(query, _id={'$gt': last_id}) if last_id else query
+            batch = list(collection.find(batch_query).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            ops = []
+            for doc in batch:
+                updates, doc_converted, doc_invalid = normalize_references(name, doc)
+                if updates:
+                    ops.append(UpdateOne({'_id': doc['_id']}, {'$set': updates}))
+                for field, n in doc_converted.items():
+                    converted[field] = converted.get(field, 0) + n
+                for field, n in doc_invalid.items():
+                    invalid[field] = invalid.get(field, 0) + n
+            docs += _flush(collection, ops)
+            last_id = batch[-1]['_id']
+            db.migrations.update_one({'_id': MIGRATION_ID}, {'$set': {f'last_ids.{name}': last_id}}, upsert=True)
+
+        summary = ', '.join(f'{f}={n}' for f, n in sorted(converted.items())) or 'sin cambios'
+        click.echo(f"✅ {name}: {docs} documentos actualizados ({summary})")
+        if invalid:
+            details = ', '.join(f'{f}={n}' for f, n in sorted(invalid.items()))
+            click.echo(f"⚠️ {name}: valores que no son ObjectId y quedaron sin convertir: {details}")
+
+    db.migrations.delete_one({'_id': MIGRATION_ID})
+
+
+@db_cli.command('apply-validators')
+def apply_validators():
+    """
+    Instala en órdenes, tareas y vehículos un validador $jsonSchema que exige
+    ObjectId en las referencias. Ejecutar después de normalize-references.
+    """
+    db = extensions.db
+    existing = set(db.list_collection_names())
+    for name, validator in VALIDATORS.items():
+        if name not in existing:
+            db.create_collection(name)
+        # 'moderate': los documentos antiguos inválidos pueden seguir actualizándose
+        db.command('collMod', name, validator=validator,
+                   validationLevel='moderate', validationAction='error')
+        click.echo(f"✅ Validador instalado en {name}")
+
+
+@db_cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Crea los índices declarados en app/services/indexes.py que falten."""
+    created = ensure_indexes()
+    for collection, names in created.items():
+        click.echo(f"✅ {collection}: {', '.join(names)}")
+    if not created:
+        click.echo("✅ Todos los índices declarados ya existen")
+
+
+@db_cli.command('verify-indexes')
+@click.pass_context
+def verify_indexes_command(ctx):
+    """
+    Compara los índices de la base con el registro: faltantes, con otras
+    opciones, no declarados y sin uso desde el último arranque del servidor.
+    Termina con código 1 si falta alguno o difiere.
+    """
+    labels = {
+        'missing': 'faltan',
+        'different': 'con otras opciones',
+        'undeclared': 'no declarados',
+        'unused': 'sin uso',
+    }
+    failed = False
+    for collection, entry in verify_indexes().items():
+        for kind, label in labels.items():
+            if entry[kind]:
+                click.echo(f"⚠️  {collection} {label}: {', '.join(entry[kind])}")
+        failed = failed or bool(entry['missing'] or entry['different'])
+    if failed:
+        ctx.exit(1)
+    click.echo("✅ Índices verificados")
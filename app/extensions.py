@@ -1,5 +1,9 @@
 # app/extensions.py
 from pymongo import MongoClient
+from flask_caching import Cache
 
 mongo = MongoClient()
 db = None
+
+# Cache compartida (se configura en app/_init_.py)
+cache = Cache()
@@ -6,6 +6,8 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import re
 from app._init_ import db 
 from bson import ObjectId
+from app.services.loaders import get_user
+from app.services.principals import invalidate_principal
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -53,7 +55,7 @@ def logout():
 @login_required
 def cambiar_clave():
     # Obtener datos del usuario actual
-    user = db.users.find_one({'_id': ObjectId(current_user.id)})
+    user = get_user(current_user.id)
     
     if request.method == 'POST':
         current_password = request.form.get('current_password')
@@ -80,6 +82,7 @@ def cambiar_clave():
             {'_id': user['_id']},
             {'$set': {'password': generate_password_hash(new_password), 'password_changed': True }}
         )
+        invalidate_principal(user['_id'])
         
         flash("Contraseña actualizada correctamente", "success")
     
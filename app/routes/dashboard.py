@@ -3,12 +3,32 @@ from flask_login import current_user, login_required
 from datetime import datetime, timedelta
 from bson import ObjectId
 import pymongo, calendar
-from app._init_ import db, cache
+from app._init_ import db
 from flask import current_app
+from app.services.loaders import fetch_map, get_user, load_users, load_vehicles, tasks_by_order
+from app.services.orders import UNASSIGNED_TECHNICIAN
+from app.services.refresh import stale_while_revalidate
+from app.services.rollups import get_stats
+from app.services.rosters import get_roster
+from app.services.stats import (MONTH_HORIZONS, daily_order_overview, monthly_order_series,
+                                technician_orders, technician_productivity, technician_workload)
 
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Dominios de los que dependen los datos cacheados de los dashboards
+DASHBOARD_DOMAINS = ('orders', 'users', 'vehicles')
+
+
+def cached_dashboard(name, build):
+    """Datos de un dashboard con stale-while-revalidate (ver app/services/refresh.py)."""
+    return stale_while_revalidate(
+        name, DASHBOARD_DOMAINS, build,
+        fresh_for=current_app.config.get('DASHBOARD_FRESH_SECONDS', 300),
+        max_stale=current_app.config.get('DASHBOARD_STALE_SECONDS', 3600)
+    )
+
+
 @dashboard_bp.route('/administrador')
 @login_required
 def administrador_dashboard():
@@ -16,72 +36,25 @@ def administrador_dashboard():
     if current_user.role != 'administrador':
         return "No autorizado", 403
     
-    # Estadísticas optimizadas
-    stats = cache.get('admin_stats')
-    if stats is None:
-        stats = get_optimized_stats()
-        cache.set('admin_stats', stats, timeout=300)   # 5 minutos
-    
-    # Obtener datos para gráficos
-    # Ventas/órdenes por mes
+    # Estadísticas optimizadas: se sirven desde la cache aunque estén vencidas
+    # y se recalculan en segundo plano
+    stats = cached_dashboard('admin_stats', get_optimized_stats)
     
-    # Obtener datos para los últimos 6 meses
-    today = datetime.now()
-    months_data = []
-    
-    for i in range(6):
-        # Mes actual - i meses
-        month_date = today - timedelta(days=30*i)
-        year = month_date.year
-        month = month_date.month
-        
-        # Nombre del mes
-        month_name = calendar.month_name[month]
-        
-        # Contar órdenes del mes
-        orders_count = db.service_orders.count_documents({
-            'created_at': {
-                '$gte': datetime(year, month, 1),
-                '$lt': datetime(year, month, calendar.monthrange(year, month)[1], 23, 59, 59)
-            },
-            'is_active': True
-        })
-        
-        months_data.append({
-            'month': month_name[:3],  # Jan, Feb, etc.
-            'orders': orders_count
-        })
+    # Órdenes por mes: una agregación para todo el horizonte (6, 12 o 24 meses)
+    months = request.args.get('meses', current_app.config.get('DASHBOARD_MONTHS', 6), type=int)
+    if months not in MONTH_HORIZONS:
+        months = MONTH_HORIZONS[0]
+    months_data = monthly_order_series(months)
     
-    # Invertir para mostrar de más antiguo a más reciente
-    months_data = months_data[::-1]
-    
-    # Estadísticas de técnicos
-    tecnicos_stats = list(db.users.aggregate([
-        {'$match': {'role': 'tecnico', 'is_active': True,'name': {'$ne': 'Sin asignar'}}},
-        {'$lookup': {
-            'from': 'service_tasks',
-            'localField': '_id',
-            'foreignField': 'technician_id',
-            'as': 'tasks'
-        }},
-        {'$project': {
-            'name': 1,
-            'total_tasks': {'$size': '$tasks'},
-            'completed_tasks': {
-                '$size': {
-                    '$filter': {
-                        'input': '$tasks',
-                        'as': 'task',
-                        'cond': {'$eq': ['$$task.status', 'completed']}
-                    }
-                }
-            }
-        }}
-    ]))
+    # Productividad de técnicos (histórica: sin ventana de fechas)
+    tecnicos_stats = technician_productivity()
+
     return render_template(
         'dashboard/administrador_dashboard.html', 
         stats=stats,
         months_data=months_data,
+        months=months,
+        month_horizons=MONTH_HORIZONS,
         tecnicos_stats=tecnicos_stats
     )
 
@@ -94,84 +67,22 @@ def tecnico_dashboard():
     # Obtener ID del técnico
     tecnico_id = ObjectId(current_user.id)
     
-    # Pipeline para obtener órdenes con tareas del técnico
-    pipeline = [
-        {'$match': {'is_active': True}},
-        {'$lookup': {
-            'from': 'service_tasks',
-            'localField': '_id',
-            'foreignField': 'order_id',
-            'as': 'tasks'
-        }},
-        {'$match': {
-            'tasks.technician_id': tecnico_id
-        }},
-        {'$lookup': {
-            'from': 'users',
-            'localField': 'client_id',
-            'foreignField': '_id',
-            'as': 'client'
-        }},
-        {'$lookup': {
-            'from': 'vehicles',
-            'localField': 'vehicle_id',
-            'foreignField': '_id',
-            'as': 'vehicle'
-        }}
-    ]
-    
-    # Obtener órdenes
-    orders = list(db.service_orders.aggregate(pipeline))
+    # Órdenes a partir de las tareas del técnico (solo sus tareas y sus conteos):
+    # todas las que tienen tareas abiertas y las completadas más recientes
+    orders = technician_orders(tecnico_id)
+    # Totales del técnico desde el resumen diario (acumulado)
+    task_counts = get_stats('technician', tecnico_id)
     
-    # Crear conjuntos para evitar duplicados
-    processed_order_ids = set()
-    
-    # Listas para categorizar
+    # Clasificar por estado de las tareas del técnico
     pending_in_progress = []
     completed = []
-    
     for order in orders:
-        # Extraer cliente y vehículo
-        order['client'] = order['client'][0] if order['client'] else {}
-        order['vehicle'] = order['vehicle'][0] if order['vehicle'] else {}
-        
-        # Filtrar tareas del técnico
-        tecnico_tasks = [task for task in order['tasks'] 
-                        if str(task.get('technician_id')) == str(tecnico_id)]
-        
-        # Si ya procesamos esta orden, saltamos
-        if str(order['_id']) in processed_order_ids:
-            continue
-            
-        # Marcar como procesada
-        processed_order_ids.add(str(order['_id']))
-        
-        # Verificar estado de tareas del técnico
-        has_pending_in_progress = any(
-            task['status'] in ['pending', 'in_progress'] 
-            for task in tecnico_tasks
-        )
-        
-        # Clasificar por estado de las tareas del técnico
-        if has_pending_in_progress:
-            # Orden en progreso para el técnico
-            order['tasks'] = tecnico_tasks  # Solo tareas del técnico
+        counts = order['task_counts']
+        if counts['pending'] + counts['in_progress'] > 0:
             pending_in_progress.append(order)
         else:
-            # Todas las tareas del técnico completadas
-            order['tasks'] = tecnico_tasks
             completed.append(order)
     
-    # Estadísticas del técnico (solo sus tareas)
-    task_counts = {
-        'pending': sum(1 for o in orders for t in o['tasks'] 
-                      if t['status'] == 'pending' and str(t['technician_id']) == str(tecnico_id)),
-        'in_progress': sum(1 for o in orders for t in o['tasks'] 
-                          if t['status'] == 'in_progress' and str(t['technician_id']) == str(tecnico_id)),
-        'completed': sum(1 for o in orders for t in o['tasks'] 
-                        if t['status'] == 'completed' and str(t['technician_id']) == str(tecnico_id))
-    }
-    
     return render_template('dashboard/tecnico_dashboard.html', 
                           pending_in_progress=pending_in_progress,
                           completed=completed,
@@ -184,132 +95,18 @@ def supervisor_dashboard():
     if current_user.role not in ['supervisor', 'administrador']:
         return "No autorizado", 403
 
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
-
-    # Órdenes del día (pendientes y en progreso)
-    today_orders = list(db.service_orders.find({
-        'created_at': {
-            '$gte': datetime.combine(today, datetime.min.time()),
-            '$lt': datetime.combine(tomorrow, datetime.min.time())
-        },
-        'status': {'$in': ['pending', 'in_progress']},
-        'is_active': True
-    }))
-
-    # Órdenes recientes completadas
-    recent_orders = list(db.service_orders.find({
-        'created_at': {
-            '$gte': datetime.combine(today, datetime.min.time()),
-            '$lt': datetime.combine(tomorrow, datetime.min.time())
-        },
-        'status': 'completed',
-        'is_active': True
-    }))
-
-    # Enriquecer cada orden con vehículo y técnicos
-    for order in today_orders + recent_orders:
-        # Vehículo
-        vehicle = db.vehicles.find_one({'_id': order.get('vehicle_id')}) if order.get('vehicle_id') else {}
-        order['vehicle_make'] = vehicle.get('make', '')
-        order['vehicle_model'] = vehicle.get('model', '')
-        order['vehicle_color'] = vehicle.get('color', '')
-        order['vehicle_plate'] = vehicle.get('plate', '')
-
-        # Técnicos asignados
-        tasks = list(db.service_tasks.find({'order_id': order['_id']}))
-        technicians = []
-        for t in tasks:
-            tech = db.users.find_one({'_id': t.get('technician_id')}) if t.get('technician_id') else None
-            if tech:
-                technicians.append(tech['name'])
-        order['technicians'] = technicians
-
-    # Información de técnicos enriquecida (solo tareas de hoy)
-    tecnicos = list(db.users.find({'role': 'tecnico', 'is_active': True,'name': {'$ne': 'Sin asignar'}}))
-    tecnicos_info = []
-    for tecnico in tecnicos:
-        tid = tecnico.get('_id')
-
-        # Construir query para cubrir ObjectId o string
-        or_clauses = []
-        if isinstance(tid, ObjectId):
-            or_clauses.append({'technician_id': tid})
-            or_clauses.append({'technician_id': str(tid)})
-        else:
-            or_clauses.append({'technician_id': tid})
-
-        # Filtrar SOLO tareas del día actual
-        tareas = list(db.service_tasks.find({
-            '$or': or_clauses,
-            'created_at': {
-                '$gte': datetime.combine(today, datetime.min.time()),
-                '$lt': datetime.combine(tomorrow, datetime.min.time())
-            }
-        }))
-
-        # Normalizar y contar estados
-        counts = {'pending': 0, 'in_progress': 0, 'completed': 0}
-        for t in tareas:
-            raw = (t.get('status') or '').lower()
-            if 'complete' in raw:
-                s = 'completed'
-            elif 'progress' in raw or 'in progress' in raw:
-                s = 'in_progress'
-            elif 'pend' in raw:
-                s = 'pending'
-            else:
-                s = 'pending'
-            counts[s] += 1
-
-        # Técnico ocupado si tiene algo pendiente o en progreso HOY
-        busy = (counts['pending'] + counts['in_progress']) > 0
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    overview = cached_dashboard(f"supervisor_dashboard:{today:%Y-%m-%d}",
+                                lambda: get_supervisor_overview(today))
 
-        # Ordenar tareas por fecha
-        tareas_sorted = sorted(
-            tareas,
-            key=lambda x: x.get('created_at') if x.get('created_at') else datetime.min,
-            reverse=True
-        )
-
-        tecnicos_info.append({
-            '_id': tecnico.get('_id'),
-            'name': tecnico.get('name', 'Sin nombre'),
-            'counts': counts,
-            'busy': busy,
-            'tareas': tareas_sorted,
-            'email': tecnico.get('email'),
-            'phone': tecnico.get('phone')
-        })
-
-    # Estadísticas generales
-    stats = {
-        'total_orders': db.service_orders.count_documents({
-            'created_at': {
-                '$gte': datetime.combine(today, datetime.min.time()),
-                '$lt': datetime.combine(tomorrow, datetime.min.time())
-            },
-            'is_active': True
-        }),
-        'active_orders': db.service_orders.count_documents({
-            'status': 'in_progress',
-            'is_active': True
-        }),
-        'completed_today': len(recent_orders),
-        'pending_orders': db.service_orders.count_documents({
-            'status': 'pending',
-            'is_active': True
-        })
-    }
-
-    user = db.users.find_one({'_id': ObjectId(current_user.id)})
+    user = get_user(current_user.id)
 
     return render_template('dashboard/supervisor_dashboard.html',
                            user=user,
-                           stats=stats,
-                           today_orders=today_orders,
-                           recent_orders=recent_orders,
-                           tecnicos_info=tecnicos_info)
+                           stats=overview['stats'],
+                           today_orders=overview['today_orders'],
+                           recent_orders=overview['recent_orders'],
+                           tecnicos_info=overview['tecnicos_info'])
 
 
 @dashboard_bp.route('/cliente')
@@ -319,7 +116,7 @@ def cliente_dashboard():
         return "No autorizado", 403
     
     # Obtener datos del cliente
-    cliente = db.users.find_one({'_id': ObjectId(current_user.id)})
+    cliente = get_user(current_user.id)
     
     # Obtener órdenes del cliente
     pipeline = [
@@ -362,58 +159,17 @@ def vendedor_dashboard():
         return "No autorizado", 403
     
     # Obtener datos del vendedor
-    vendedor = db.users.find_one({'_id': ObjectId(current_user.id)})
-    
-    # ✅ ID del vendedor actual
-    current_vendor_id = ObjectId(current_user.id)
-    
-    # ✅ Estadísticas: Órdenes asignadas al vendedor
-    stats = {
-        'total_clientes': db.users.count_documents({
-            'role': 'cliente', 
-            'is_active': True,
-            'created_by': current_vendor_id  # Clientes que creó el vendedor
-        }),
-        'total_ordenes': db.service_orders.count_documents({
-            'is_active': True,
-            'assigned_vendor_id': current_vendor_id  # ✅ Solo órdenes asignadas
-        }),
-        'ordenes_pendientes': db.service_orders.count_documents({
-            'status': 'pending', 
-            'is_active': True,
-            'assigned_vendor_id': current_vendor_id  # ✅ Filtrar por asignación
-        }),
-        'ordenes_progreso': db.service_orders.count_documents({
-            'status': 'in_progress', 
-            'is_active': True,
-            'assigned_vendor_id': current_vendor_id  # ✅ Filtrar por asignación
-        })
-    }
+    vendedor = get_user(current_user.id)
     
-    # ✅ Órdenes recientes: Solo asignadas al vendedor
-    from datetime import datetime, timedelta
-    fecha_limite = datetime.now() - timedelta(days=30)
-    
-    ordenes_recientes = list(db.service_orders.find({
-        'created_at': {'$gte': fecha_limite},
-        'is_active': True,
-        'assigned_vendor_id': current_vendor_id  # ✅ Filtrar por asignación
-    }).sort('created_at', -1).limit(5))
-    
-    # Poblar datos de clientes y vehículos (código existente)
-    for orden in ordenes_recientes:
-        if orden.get('client_id'):
-            cliente = db.users.find_one({'_id': orden['client_id']})
-            orden['cliente_nombre'] = cliente.get('name', 'Sin nombre') if cliente else 'Sin nombre'
-        
-        if orden.get('vehicle_id'):
-            vehiculo = db.vehicles.find_one({'_id': orden['vehicle_id']})
-            orden['vehiculo_placa'] = vehiculo.get('plate', 'Sin placa') if vehiculo else 'Sin placa'
+    # Estadísticas y órdenes recientes del vendedor (stale-while-revalidate)
+    vendor_id = ObjectId(current_user.id)
+    overview = cached_dashboard(f"vendor_dashboard:{vendor_id}",
+                                lambda: get_vendor_overview(vendor_id))
     
     return render_template(
         'dashboard/vendedor_dashboard.html',
-        stats=stats,
-        ordenes_recientes=ordenes_recientes,
+        stats=overview['stats'],
+        ordenes_recientes=overview['ordenes_recientes'],
         vendedor=vendedor
     )
 
@@ -425,7 +181,7 @@ def tecnico_detalle(tecnico_id):
     
     # Obtener el técnico
     try:
-        tecnico = db.users.find_one({'_id': ObjectId(tecnico_id)})
+        tecnico = get_user(ObjectId(tecnico_id))
         if not tecnico or tecnico['role'] != 'tecnico':
             return "Técnico no válido", 404
     except:
@@ -438,46 +194,11 @@ def tecnico_detalle(tecnico_id):
     except:
         fecha_dt = datetime.now()
     
-    # Obtener órdenes del técnico en esa fecha
+    # Tareas del técnico creadas en esa fecha, agrupadas por orden
     start_date = datetime.combine(fecha_dt, datetime.min.time())
     end_date = start_date + timedelta(days=1)
-    
-    pipeline = [
-        {'$match': {
-            'created_at': {'$gte': start_date, '$lt': end_date},
-            'is_active': True
-        }},
-        {'$lookup': {
-            'from': 'service_tasks',
-            'localField': '_id',
-            'foreignField': 'order_id',
-            'as': 'tasks'
-        }},
-        {'$match': {
-            'tasks.technician_id': ObjectId(tecnico_id)
-        }},
-        {'$lookup': {
-            'from': 'vehicles',
-            'localField': 'vehicle_id',
-            'foreignField': '_id',
-            'as': 'vehicle'
-        }}
-    ]
-    
-    orders = list(db.service_orders.aggregate(pipeline))
-    
-    # Filtrar tareas del técnico
-    for order in orders:
-        order['tasks'] = [t for t in order['tasks'] 
-                         if str(t['technician_id']) == tecnico_id]
-        order['vehicle'] = order['vehicle'][0] if order['vehicle'] else {}
-    
-    # Estadísticas del día
-    task_counts = {
-        'pending': sum(1 for o in orders for t in o['tasks'] if t['status'] == 'pending'),
-        'in_progress': sum(1 for o in orders for t in o['tasks'] if t['status'] == 'in_progress'),
-        'completed': sum(1 for o in orders for t in o['tasks'] if t['status'] == 'completed')
-    }
+    orders = technician_orders(tecnico['_id'], start_date, end_date)
+    task_counts = get_stats('technician', tecnico['_id'], day=start_date)
     
     return render_template(
         'dashboard/tecnico_detalle.html',
@@ -488,6 +209,98 @@ def tecnico_detalle(tecnico_id):
         from_page='detalle_tecnico'
     )
 
+def get_supervisor_overview(start):
+    """Órdenes del día `start`, cifras y carga de trabajo de los técnicos para el supervisor."""
+    end = start + timedelta(days=1)
+
+    # Órdenes del día; cifras generales desde el resumen diario
+    orders, stats = daily_order_overview(start, end)
+    today_orders = [o for o in orders if o.get('status') in ('pending', 'in_progress')]
+    recent_orders = [o for o in orders if o.get('status') == 'completed']
+
+    # Enriquecer con vehículo y técnicos: una consulta por colección
+    vehicles = fetch_map('vehicles', [o.get('vehicle_id') for o in orders],
+                         projection={'make': 1, 'model': 1, 'color': 1, 'plate': 1})
+    tasks = tasks_by_order([o['_id'] for o in orders], projection={'order_id': 1, 'technician_id': 1})
+    technicians = fetch_map('users', [t.get('technician_id') for ts in tasks.values() for t in ts],
+                            projection={'name': 1})
+    for order in orders:
+        vehicle = vehicles.get(order.get('vehicle_id')) or {}
+        order['vehicle_make'] = vehicle.get('make', '')
+        order['vehicle_model'] = vehicle.get('model', '')
+        order['vehicle_color'] = vehicle.get('color', '')
+        order['vehicle_plate'] = vehicle.get('plate', '')
+        order['technicians'] = [
+            technicians[t['technician_id']]['name']
+            for t in tasks.get(order['_id'], [])
+            if t.get('technician_id') in technicians
+        ]
+
+    # Carga de trabajo de hoy por técnico (conteos del resumen diario)
+    tecnicos = [t for t in get_roster('tecnico', detail=True) if t.get('name') != UNASSIGNED_TECHNICIAN]
+    workload = technician_workload([t['_id'] for t in tecnicos], start, end)
+    tecnicos_info = []
+    for tecnico in tecnicos:
+        entry = workload[tecnico['_id']]
+        counts = entry['counts']
+        tecnicos_info.append({
+            '_id': tecnico['_id'],
+            'name': tecnico.get('name') or 'Sin nombre',
+            'counts': counts,
+            # Ocupado si tiene algo pendiente o en progreso HOY
+            'busy': (counts['pending'] + counts['in_progress']) > 0,
+            'last_task': entry.get('last_task'),
+            'email': tecnico.get('email'),
+            'phone': tecnico.get('phone')
+        })
+
+    return {
+        'stats': stats,
+        'today_orders': today_orders,
+        'recent_orders': recent_orders,
+        'tecnicos_info': tecnicos_info,
+    }
+
+
+def get_vendor_overview(current_vendor_id):
+    """Estadísticas y órdenes recientes (30 días) asignadas a un vendedor."""
+    # ✅ Estadísticas: Órdenes asignadas al vendedor (acumulado del resumen diario)
+    vendor_counts = get_stats('vendor', current_vendor_id)
+    stats = {
+        'total_clientes': db.users.count_documents({
+            'role': 'cliente', 
+            'is_active': True,
+            'created_by': current_vendor_id  # Clientes que creó el vendedor
+        }),
+        'total_ordenes': sum(vendor_counts.values()),
+        'ordenes_pendientes': vendor_counts['pending'],
+        'ordenes_progreso': vendor_counts['in_progress']
+    }
+    
+    # ✅ Órdenes recientes: Solo asignadas al vendedor
+    fecha_limite = datetime.now() - timedelta(days=30)
+    
+    ordenes_recientes = list(db.service_orders.find({
+        'created_at': {'$gte': fecha_limite},
+        'is_active': True,
+        'assigned_vendor_id': current_vendor_id  # ✅ Filtrar por asignación
+    }).sort('created_at', -1).limit(5))
+    
+    # Poblar datos de clientes y vehículos (una consulta $in por colección)
+    clientes = load_users([o.get('client_id') for o in ordenes_recientes])
+    vehiculos = load_vehicles([o.get('vehicle_id') for o in ordenes_recientes])
+    for orden in ordenes_recientes:
+        if orden.get('client_id'):
+            cliente = clientes.get(orden['client_id'])
+            orden['cliente_nombre'] = cliente.get('name', 'Sin nombre') if cliente else 'Sin nombre'
+        
+        if orden.get('vehicle_id'):
+            vehiculo = vehiculos.get(orden['vehicle_id'])
+            orden['vehiculo_placa'] = vehiculo.get('plate', 'Sin placa') if vehiculo else 'Sin placa'
+    
+    return {'stats': stats, 'ordenes_recientes': ordenes_recientes}
+
+
 def get_optimized_stats():
     """Obtiene estadísticas del dashboard admin con consultas optimizadas"""
     # Obtener conteo por roles en una sola consulta
@@ -507,7 +320,7 @@ def get_optimized_stats():
     
     # Obtener conteo de vehículos y órdenes
     total_vehicles = db.vehicles.count_documents({'is_active': True})
-    total_orders = db.service_orders.count_documents({'is_active': True})
+    total_orders = sum(get_stats('orders').values())
     
     # Órdenes recientes
     recent_orders = list(db.service_orders.find({
@@ -515,21 +328,20 @@ def get_optimized_stats():
         'status': {'$in': ['in_progress', 'pending']}
     }).sort("created_at", -1).limit(5))
     
-    # Poblar datos de clientes y vehículos
+    # Poblar datos de clientes y vehículos (una consulta $in por colección)
+    clients = load_users([o.get('client_id') for o in recent_orders])
+    vehicles = load_vehicles([o.get('vehicle_id') for o in recent_orders])
     for order in recent_orders:
         if order.get('client_id'):
-            client = db.users.find_one({
-                '_id': ObjectId(order['client_id']),
-                'role': 'cliente',
-                'is_active': True
-            })
+            client = clients.get(order['client_id'])
+            if client and (client.get('role') != 'cliente' or not client.get('is_active')):
+                client = None
             order['client_name'] = client.get('name', 'Sin nombre') if client else 'Sin nombre'
             
         if order.get('vehicle_id'):
-            vehicle = db.vehicles.find_one({
-                '_id': ObjectId(order['vehicle_id']),
-                'is_active': True
-            })
+            vehicle = vehicles.get(order['vehicle_id'])
+            if vehicle and not vehicle.get('is_active'):
+                vehicle = None
             order['vehicle_plate'] = vehicle.get('plate', 'Sin placa') if vehicle else 'Sin placa'
     
     return {
@@ -1,57 +1,75 @@
-from flask import Blueprint, request, redirect, url_for, flash, render_template, jsonify
+from flask import Blueprint, request, redirect, url_for, flash, render_template, jsonify, Response, stream_with_context, current_app
 from flask_login import current_user, login_required
 from app._init_ import mongo, db
 from datetime import datetime, timedelta
 from bson import ObjectId
-from pymongo import ReturnDocument
 from app.helpers import update_order_status, validate_object_id
-import re
-from app._init_ import cache
+from app.services.loaders import fetch_map, get_user, get_vehicle, load_users, tasks_by_order
+from app.services.pagination import keyset_facet
+from app.services.counters import get_order_counters, format_order_number
+from app.services.generations import bump_generation
+from app.services.export import export_rows, EXPORT_FORMATS, EXPORT_MIMETYPES
+from app.services.orders import (add_order_technician, task_deltas, apply_task_deltas,
+                                 normalize_task_status, save_order_tasks)
+from app.services.rollups import order_changes, record_changes, task_changes, vendor_changes
+from app.services.rosters import get_roster
+from app.services.search import normalize_plate, plate_prefix_query, search_people
+from pymongo.errors import DuplicateKeyError
 
 
 ordenes_bp = Blueprint('ordenes', __name__)
 
-@ordenes_bp.route('/list')
-@login_required
-def list_ordenes():
-    if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
-        return "No autorizado", 403
-    
-    from bson import ObjectId
-    
+# Máximo de clientes que puede aportar el filtro por nombre en list_ordenes
+CLIENT_FILTER_LIMIT = 50
+
+# Exportación: órdenes leídas (y resueltas con $in) por lote
+EXPORT_BATCH_SIZE = 500
+EXPORT_PROJECTION = {
+    'order_number': 1, 'created_at': 1, 'status': 1, 'registration_status': 1,
+    'client_id': 1, 'vehicle_id': 1, 'description': 1,
+}
+
+def build_order_filters(args):
+    """
+    Construye el filtro de órdenes a partir de los parámetros de la petición.
+    Lo comparten la lista (list_ordenes) y la exportación (exportar_ordenes).
+    Devuelve (query, filtros) donde filtros son los valores ya limpios.
+    """
     # Obtener parámetros de búsqueda
-    tech_id = request.args.get('technician', '').strip()
-    client_query = request.args.get('client', '').strip()
-    status_filter = request.args.get('status', '').strip()
-    plate_query = request.args.get('plate', '').strip()
-    date_from = request.args.get('date_from', '').strip()
-    date_to = request.args.get('date_to', '').strip()
-    clear_filters = request.args.get('clear', '').strip()
+    filters = {
+        'tech_id': args.get('technician', '').strip(),
+        'client_query': args.get('client', '').strip(),
+        'status_filter': args.get('status', '').strip(),
+        'plate_query': args.get('plate', '').strip(),
+        'date_from': args.get('date_from', '').strip(),
+        'date_to': args.get('date_to', '').strip(),
+    }
     
     # Si el usuario presiona el botón de limpiar, no aplicar filtros
-    if clear_filters:
-        tech_id = client_query = status_filter = plate_query = date_from = date_to = ''
+    if args.get('clear', '').strip():
+        filters = {key: '' for key in filters}
+
+    tech_id = filters['tech_id']
+    client_query = filters['client_query']
+    status_filter = filters['status_filter']
+    plate_query = filters['plate_query']
+    date_from = filters['date_from']
+    date_to = filters['date_to']
     
     query = {'is_active': True}
     
     # Filtro por técnico
+    # (technician_ids se mantiene en la orden; índice (technician_ids, created_at))
     if tech_id:
         try:
-            tasks = list(db.service_tasks.find({
-                'technician_id': ObjectId(tech_id)
-            }, {'order_id': 1}))
-            order_ids = [t['order_id'] for t in tasks]
-            query['_id'] = {'$in': order_ids} if order_ids else {'$in': []}
+            query['technician_ids'] = ObjectId(tech_id)
         except:
             pass
     
     # Filtro por cliente
     if client_query:
-        client_ids = [c['_id'] for c in db.users.find({
-            'role': 'cliente',
-            'is_active': True,
-            'name': {'$regex': client_query, '$options': 'i'}
-        })]
+        # Búsqueda indexada por prefijo de palabras; se limita para no generar un $in enorme
+        client_ids = [c['_id'] for c in search_people('cliente', client_query, limit=CLIENT_FILTER_LIMIT)]
         try:
             client_by_id = db.users.find_one({
                 'role': 'cliente',
@@ -70,11 +88,11 @@ def list_ordenes():
         query['status'] = status_filter
     
     # Filtro por placa
-    if plate_query:
-        vehicle_ids = [v['_id'] for v in db.vehicles.find({
-            'is_active': True,
-            'plate': {'$regex': plate_query, '$options': 'i'}
-        })]
+    plate_filter = plate_prefix_query(plate_query)
+    if plate_filter:
+        vehicle_ids = [v['_id'] for v in db.vehicles.find(
+            dict(plate_filter, is_active=True), {'_id': 1}
+        )]
         if vehicle_ids:
             query['vehicle_id'] = {'$in': vehicle_ids}
 
@@ -97,64 +115,112 @@ def list_ordenes():
                 
         if date_query:
             query['created_at'] = date_query
-    
-    # Buscar órdenes
-# Paginación
-    page = int(request.args.get('page', 1))
-    per_page = 20
-    skip = (page - 1) * per_page
 
-    ordenes = list(
-        db.service_orders.find(query)
-        .sort('created_at', -1)
-        .skip(skip)
-        .limit(per_page)
-    )
-    
-    # Poblar datos para cada orden
+    return query, filters
+
+
+def populate_order_rows(ordenes):
+    """Agrega cliente, vehículo y técnicos a un lote de órdenes con consultas $in."""
+    clients = fetch_map('users', [o.get('client_id') for o in ordenes],
+                        {'role': 'cliente', 'is_active': True}, {'name': 1})
+    vehicles = fetch_map('vehicles', [o.get('vehicle_id') for o in ordenes],
+                         {'is_active': True}, {'plate': 1, 'make': 1, 'model': 1})
+    tasks_map = tasks_by_order([o['_id'] for o in ordenes], {'order_id': 1, 'technician_id': 1})
+    techs = fetch_map('users', [t.get('technician_id') for ts in tasks_map.values() for t in ts],
+                      {'is_active': True}, {'name': 1})
+
     for order in ordenes:
         if order.get('client_id'):
-            client = db.users.find_one({
-                '_id': ObjectId(order['client_id']),
-                'role': 'cliente',
-                'is_active': True
-            })
+            client = clients.get(order['client_id'])
             order['client_name'] = client.get('name', 'Sin nombre') if client else 'Sin nombre'
     
         if order.get('vehicle_id'):
-            vehicle = db.vehicles.find_one({
-                '_id': ObjectId(order['vehicle_id']),
-                'is_active': True
-            })
+            vehicle = vehicles.get(order['vehicle_id'])
             order['vehicle_plate'] = vehicle.get('plate', 'Sin placa') if vehicle else 'Sin placa'
             order['vehicle_make'] = vehicle.get('make', 'Sin marca') if vehicle else 'Sin marca'
             order['vehicle_model'] = vehicle.get('model', 'Sin modelo') if vehicle else 'Sin modelo'
     
-        tasks = list(db.service_tasks.find({'order_id': order['_id']}))
         order['tasks'] = []
-        for t in tasks:
-            tech = db.users.find_one({
-                '_id': t['technician_id'],
-                'is_active': True
-            })
+        for t in tasks_map.get(order['_id'], []):
+            tech = techs.get(t['technician_id'])
             order['tasks'].append({
                 'technician_name': tech['name'] if tech else 'Sin técnico'
             })
+    return ordenes
+
+
+@ordenes_bp.route('/list')
+@login_required
+def list_ordenes():
+    if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
+        return "No autorizado", 403
     
-    tecnicos = list(db.users.find({'role': 'tecnico', 'is_active': True}))
+    query, filters = build_order_filters(request.args)
+    
+    # Buscar órdenes
+    # Paginación por cursor sobre el índice (created_at, _id); total y conteo por estado en un $facet
+    per_page = 20
+    ordenes, next_cursor, prev_cursor, facets = keyset_facet(
+        db.service_orders, query, 'created_at', -1,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=per_page,
+        facets={
+            'total': [{'$count': 'count'}],
+            'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+        }
+    )
+    total_results = facets['total'][0]['count'] if facets.get('total') else 0
+    status_counts = {'pending': 0, 'in_progress': 0, 'completed': 0}
+    for row in facets.get('by_status', []):
+        status_counts[row['_id']] = row['count']
+    
+    # Poblar datos relacionados con consultas por lotes ($in)
+    populate_order_rows(ordenes)
+    
+    tecnicos = get_roster('tecnico')
     
     return render_template(
         'ordenes/ordenes.html',
         orders=ordenes,
         tecnicos=tecnicos,
-        tech_id=tech_id,
-        client_query=client_query,
-        status_filter=status_filter,
-        plate_query=plate_query,
-        date_from=date_from,
-        date_to=date_to,
-        page=page,
-        per_page=per_page
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        total_results=total_results,
+        status_counts=status_counts,
+        per_page=per_page,
+        **filters
+    )
+
+
+@ordenes_bp.route('/exportar')
+@login_required
+def exportar_ordenes():
+    """Exporta (CSV o NDJSON) las órdenes con los mismos filtros de list_ordenes."""
+    if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
+        return "No autorizado", 403
+
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return "Formato no soportado", 400
+
+    query, filters = build_order_filters(request.args)
+    cursor = (
+        db.service_orders.find(query, EXPORT_PROJECTION)
+        .sort('created_at', -1)
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    rows = export_rows(cursor, populate_order_rows, EXPORT_BATCH_SIZE)
+
+    from app.services.audit import log_action
+    applied = {k: v for k, v in filters.items() if v}
+    log_action(current_user.name, "EXPORTAR_ORDENES", f"format={fmt} filtros={applied}")
+
+    filename = f"ordenes_{datetime.now():%Y%m%d_%H%M}.{fmt}"
+    return Response(
+        stream_with_context(EXPORT_FORMATS[fmt](rows)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
     )
 
 @ordenes_bp.route('/nueva', methods=['GET', 'POST'])
@@ -173,51 +239,52 @@ def nueva_orden():
     if request.method == 'POST':
         quick_search = request.form.get('quick_search', '').strip()
         
-        # Validar placa (solo alfanuméricos y guiones)
-        if not re.match(r'^[A-Za-z0-9-]+$', quick_search):
+        # Validar placa (solo letras, incluida la Ñ, números y guiones)
+        if not quick_search or not all(ch.isalnum() or ch == '-' for ch in quick_search):
             flash("Formato de placa inválido. Solo se permiten letras, números y guiones.", "danger")
             return redirect(url_for('ordenes.nueva_orden'))        
         # **NUEVO: Generar número de orden con contador atómico**
         try:
-            monthly_counter, yearly_counter, year, month = get_order_counters()
+            counters = get_order_counters(current_app.config.get('ORDER_NUMBER_BLOCK_SIZE', 1))
         
         # **NUEVO: Formato correcto con ceros a la izquierda**
-            order_number = f"ORD-{year}-{month:02d}-{monthly_counter:04d}-{yearly_counter:06d}"
+            order_number = format_order_number(*counters)
         
         except Exception as e:
         # Manejar error (ej: inicializar contadores)
             return str(e), 500
         
-        # Buscar vehículo por placa
-        vehicle = db.vehicles.find_one({'plate': quick_search})
-        if vehicle:
-            vehicle_id = vehicle['_id']
-            
-            # **NUEVO: Buscar cliente activo en relations**
-            client_id = None
-            if 'relations' in vehicle and vehicle['relations']:
-                for relation in vehicle['relations']:
-                    if relation.get('is_active', False):
-                        client_id = relation.get('client_id')
-                        break
-            
-            # Obtener datos del cliente si existe
-            client = None
-            if client_id:
-                client = db.users.find_one({'_id': ObjectId(client_id)})
-                
-        else:
+        # Buscar vehículo por placa normalizada (índice único plate_key)
+        plate_key = normalize_plate(quick_search)
+        vehicle = db.vehicles.find_one({'plate_key': plate_key})
+        if not vehicle:
             # Crear nuevo vehículo temporal
-            new_vehicle = {
+            vehicle = {
                 'plate': quick_search,
+                'plate_key': plate_key,
                 'relations': [],
                 "is_active": True,
                 'created_at': datetime.now()
             }
-            result = db.vehicles.insert_one(new_vehicle)
-            cache.delete('admin_stats')
-            vehicle_id = result.inserted_id
-            client_id = None
+            try:
+                db.vehicles.insert_one(vehicle)
+                bump_generation('vehicles')
+            except DuplicateKeyError:
+                # Otra petición lo creó al mismo tiempo, o ya existe con la
+                # misma placa y sin plate_key (no migrado): usar ese vehículo
+                vehicle = (db.vehicles.find_one({'plate_key': plate_key})
+                           or db.vehicles.find_one({'plate': quick_search}))
+                if not vehicle:
+                    flash("Placa ya registrada", "danger")
+                    return redirect(url_for('ordenes.nueva_orden'))
+        vehicle_id = vehicle['_id']
+        
+        # Cliente activo en relations (un vehículo recién creado no tiene)
+        client_id = None
+        for relation in vehicle.get('relations') or []:
+            if relation.get('is_active', False):
+                client_id = relation.get('client_id')
+                break
         
         # Crear orden con estado según si hay cliente
         order = {
@@ -232,6 +299,8 @@ def nueva_orden():
             "created_at": datetime.now(),
             "updated_at": datetime.now(),
             "created_by": ObjectId(current_user.id),
+            "technician_ids": [],
+            "task_counts": {'pending': 0, 'in_progress': 0, 'completed': 0},
         }
         # ✅ Asignar vendedor si el usuario es vendedor
         if current_user.role == 'vendedor':
@@ -239,9 +308,10 @@ def nueva_orden():
         # Insertar orden
         result = db.service_orders.insert_one(order)
         order_id = result.inserted_id
+        record_changes(order_changes(order, None, 'pending'))
         from app.services.audit import log_action
         log_action(current_user.name, "CREAR_ORDEN", f"order_id={order_id} plate={quick_search}") 
-        cache.delete('admin_stats')
+        bump_generation('orders')
         
         return redirect(url_for('ordenes.detalle_orden', order_id=order_id))
     
@@ -254,11 +324,19 @@ def eliminar_orden(order_id):
     if current_user.role != 'administrador':
         return "No autorizado", 403
     update_order_status
-    db.service_orders.update_one(
-        {'_id': ObjectId(order_id)},
-        {'$set': {'is_active': False}}
+    before = db.service_orders.find_one_and_update(
+        {'_id': ObjectId(order_id), 'is_active': True},
+        {'$set': {'is_active': False}},
+        projection={'status': 1, 'created_at': 1, 'assigned_vendor_id': 1}
     )
-    cache.delete('admin_stats')
+    if before:
+        # La orden y sus tareas dejan de contar en el resumen diario
+        changes = order_changes(before, normalize_task_status(before.get('status')), None)
+        for task in db.service_tasks.find({'order_id': before['_id']},
+                                          {'technician_id': 1, 'status': 1, 'created_at': 1}):
+            changes += task_changes(task, normalize_task_status(task.get('status')), None)
+        record_changes(changes)
+    bump_generation('orders')
     from app.services.audit import log_action
     log_action(current_user.name, "ELIMINAR_ORDEN", f"order_id={order_id}")    
     return redirect(url_for('ordenes.list_ordenes'))
@@ -272,8 +350,9 @@ def actualizar_estado_orden(order_id):
     # Validar ID
     order_id = validate_object_id(order_id)
     
-    # Actualizar estado basado en tareas
+    # Recalcular contadores y estado desde las tareas
     update_order_status(order_id)
+    bump_generation('orders')
     
     # Obtener el estado actual para devolverlo
     order = db.service_orders.find_one({'_id': order_id})
@@ -281,6 +360,39 @@ def actualizar_estado_orden(order_id):
     log_action(current_user.name, "CAMBIAR_ESTADO_ORDEN", f"order_id={order_id} plate={quick_search}")
     return jsonify({'success': True, 'new_status': order['status']})
 
+def order_detail_pipeline(order_oid):
+    """
+    Agregación para el detalle de una orden: la orden y sus relaciones
+    (cliente, vehículo, creador, vendedor asignado y tareas) en un solo viaje.
+    Las relaciones simples quedan como documento (o ausentes) y se excluyen
+    las contraseñas. Las referencias son ObjectId (`flask db normalize-references`
+    y los validadores de app/services/schema.py).
+    """
+    relations = [
+        ('client_id', 'users', 'client'),
+        ('vehicle_id', 'vehicles', 'vehicle'),
+        ('created_by', 'users', 'creator'),
+        ('assigned_vendor_id', 'users', 'assigned_vendor_doc'),
+    ]
+    pipeline = [{'$match': {'_id': order_oid}}]
+    for local_field, collection, alias in relations:
+        pipeline += [
+            {'$lookup': {'from': collection, 'localField': local_field,
+                         'foreignField': '_id', 'as': alias}},
+            {'$set': {alias: {'$arrayElemAt': [f'${alias}', 0]}}},
+        ]
+    pipeline += [
+        {'$lookup': {'from': 'service_tasks', 'localField': '_id',
+                     'foreignField': 'order_id', 'as': 'tasks'}},
+        {'$project': {
+            f'{alias}.{field}': 0
+            for _, collection, alias in relations if collection == 'users'
+            for field in ('password', 'name_tokens')
+        }},
+    ]
+    return pipeline
+
+
 @ordenes_bp.route('/detalle/<order_id>', methods=['GET', 'POST'])
 @login_required
 def detalle_orden(order_id):
@@ -291,75 +403,21 @@ def detalle_orden(order_id):
     from_page = request.args.get('from_page', 'list_ordenes')  # Default a lista
     tecnico_id = request.args.get('tecnico_id', None)          # ✅ tu línea original
 
-    # Obtener la orden
-    order = db.service_orders.find_one({'_id': ObjectId(order_id)})
-    if not order:
+    try:
+        order_oid = ObjectId(order_id)
+    except Exception:
         return "Orden no encontrada", 404
 
-    # Cliente
-    client = None
-    if order.get('client_id'):
-        try:
-            client = db.users.find_one({'_id': ObjectId(order['client_id'])})
-        except:
-            client = None
-
-    # Vehículo
-    vehicle = None
-    if order.get('vehicle_id'):
-        try:
-            vehicle = db.vehicles.find_one({'_id': ObjectId(order['vehicle_id'])})
-        except:
-            vehicle = None
-
-    # Creador
-    creator = None
-    if order.get('created_by'):
-        try:
-            creator = db.users.find_one({'_id': ObjectId(order['created_by'])})
-        except:
-            creator = None
-
-    # Tareas
-    tasks = list(db.service_tasks.find({'order_id': order['_id']}))
-
-    # Técnicos
-    tecnicos = list(db.users.find({'role': 'tecnico', 'is_active': True}))
-
-    # --- NUEVO: lista de vendedores y vendedor asignado ---
-    vendedores = list(db.users.find({'role': 'vendedor', 'is_active': True}))
-    assigned_vendor = None
-    if order.get('assigned_vendor_id'):
-        try:
-            assigned_vendor = db.users.find_one({'_id': ObjectId(order['assigned_vendor_id'])})
-        except:
-            assigned_vendor = None
-
-    # Técnico actual (si aplica)
-    tecnico = None
-    if current_user.role == 'tecnico':
-        try:
-            tecnico = db.users.find_one({'_id': ObjectId(current_user.id)})
-            tecnico_id = str(tecnico['_id']) if tecnico else tecnico_id
-        except:
-            tecnico = None
-
-    # Permisos
-    can_edit_all = (current_user.role == 'administrador')
-    can_edit_supervisor = (current_user.role == 'supervisor')
-    can_add_tasks = (current_user.role in ['administrador', 'supervisor'])
-    read_only = (current_user.role == 'cliente')
-
     # --- Manejo POST para asignar vendedor ---
     if request.method == 'POST' and current_user.role in ['administrador', 'supervisor']:
         vendedor_id = request.form.get('vendedor_id')
         if vendedor_id:
             try:
                 vendedor_obj = ObjectId(vendedor_id)
-                vendedor_user = db.users.find_one({'_id': vendedor_obj, 'role': 'vendedor', 'is_active': True})
+                vendedor_user = db.users.find_one({'_id': vendedor_obj, 'role': 'vendedor', 'is_active': True}, {'_id': 1})
                 if vendedor_user:
                     db.service_orders.update_one(
-                        {'_id': order['_id']},
+                        {'_id': order_oid},
                         {'$set': {'assigned_vendor': vendedor_obj, 'updated_at': datetime.now()}}
                     )
                     flash("Vendedor asignado correctamente.", "success")
@@ -370,6 +428,33 @@ def detalle_orden(order_id):
 
         return redirect(url_for('ordenes.detalle_orden', order_id=order_id))
 
+    # Orden con cliente, vehículo, creador, vendedor y tareas en una sola agregación
+    order = next(db.service_orders.aggregate(order_detail_pipeline(order_oid)), None)
+    if not order:
+        return "Orden no encontrada", 404
+
+    client = order.pop('client', None) or None
+    vehicle = order.pop('vehicle', None) or None
+    creator = order.pop('creator', None) or None
+    assigned_vendor = order.pop('assigned_vendor_doc', None) or None
+    tasks = order.pop('tasks', [])
+
+    # Técnicos y vendedores desde la cache de listas de personal
+    tecnicos = get_roster('tecnico')
+    vendedores = get_roster('vendedor')
+
+    # Técnico actual (si aplica)
+    tecnico = None
+    if current_user.role == 'tecnico':
+        tecnico = next((t for t in tecnicos if str(t['_id']) == current_user.id), None)
+        tecnico_id = str(tecnico['_id']) if tecnico else tecnico_id
+
+    # Permisos
+    can_edit_all = (current_user.role == 'administrador')
+    can_edit_supervisor = (current_user.role == 'supervisor')
+    can_add_tasks = (current_user.role in ['administrador', 'supervisor'])
+    read_only = (current_user.role == 'cliente')
+
     # Render
     return render_template(
         'ordenes/detalle_orden.html',
@@ -406,7 +491,7 @@ def agregar_tarea(order_id):
         flash("Descripción de tarea y técnico son requeridos")
         return redirect(url_for('ordenes.detalle_orden', order_id=order_id))
     
-    db.service_tasks.insert_one({
+    task = {
         'order_id': ObjectId(order_id),
         'technician_id': ObjectId(technician_id),
         'description': task_description,
@@ -415,7 +500,11 @@ def agregar_tarea(order_id):
         'end_time': None,
         'observations': '',
         'created_at': datetime.now()
-    })
+    }
+    db.service_tasks.insert_one(task)
+    record_changes(task_changes(task, None, 'pending'))
+    add_order_technician(order_id, technician_id)
+    apply_order_task_changes(order_id, [(None, 'pending')])
     
     flash("Tarea agregada correctamente", "success")
     return redirect(url_for('ordenes.detalle_orden', order_id=order_id))
@@ -427,7 +516,7 @@ def tareas_tecnico():
         return "No autorizado", 403
     
     # Obtener técnico actual
-    technician = db.users.find_one({'_id': ObjectId(current_user.id)})
+    technician = get_user(current_user.id)
     
     # Pipeline más completo
     pipeline = [
@@ -473,11 +562,11 @@ def ver_orden_tecnico(order_id):
     # Obtener la orden con todos los datos
     order = db.service_orders.find_one({'_id': ObjectId(order_id)})
     # Obtener datos relacionados
-    client = db.users.find_one({'_id': order['client_id']})
-    vehicle = db.vehicles.find_one({'_id': order['vehicle_id']})
+    client = get_user(order['client_id'])
+    vehicle = get_vehicle(order['vehicle_id'])
     
     # Obtener tareas de la orden asignadas al técnico
-    technician = db.users.find_one({'_id': ObjectId(current_user.id)})
+    technician = get_user(current_user.id)
     tasks = list(db.service_tasks.find({
         'order_id': ObjectId(order_id),
         'technician_id': technician['_id']
@@ -498,24 +587,32 @@ def actualizar_tareas_tecnico(order_id):
     technician = db.technicians.find_one({'user_id': ObjectId(current_user.id)})
     
     # Procesar cada tarea
+    changes, rollup = [], []
     for key, value in request.form.items():
         if key.startswith('task-'):
             task_id = key.split('-')[1]
             status = value
             observations = request.form.get(f'obs-{task_id}', '')
             
-            # Actualizar tarea
-            db.service_tasks.update_one(
-                {'_id': ObjectId(task_id)},
+            # Actualizar tarea (devuelve el estado anterior para los contadores).
+            # Solo tareas de esta orden: los contadores que se ajustan son los suyos
+            before = db.service_tasks.find_one_and_update(
+                {'_id': ObjectId(task_id), 'order_id': ObjectId(order_id)},
                 {'$set': {
                     'status': status,
                     'observations': observations,
                     'updated_at': datetime.now()
-                }}
+                }},
+                projection={'status': 1, 'technician_id': 1, 'created_at': 1}
             )
+            if before:
+                change = (normalize_task_status(before.get('status')), normalize_task_status(status))
+                changes.append(change)
+                rollup += task_changes(before, *change)
     
-    # Actualizar estado de la orden
-    update_order_status(ObjectId(order_id))
+    # Actualizar estado de la orden y el resumen diario
+    record_changes(rollup)
+    apply_order_task_changes(order_id, changes)
     
     flash("Tareas actualizadas correctamente", "success")
     return redirect(url_for('ordenes.ver_orden_tecnico', order_id=order_id))
@@ -530,8 +627,8 @@ def ver_tarea(task_id):
     
     # Obtener datos relacionados
     order = db.service_orders.find_one({'_id': task['order_id']})
-    client = db.users.find_one({'_id': order['client_id']})
-    vehicle = db.vehicles.find_one({'_id': order['vehicle_id']})
+    client = get_user(order['client_id'])
+    vehicle = get_vehicle(order['vehicle_id'])
     
     return render_template('ordenes/ver_tarea.html', task=task, order=order, client=client, vehicle=vehicle)
 
@@ -551,7 +648,7 @@ def actualizar_tarea(order_id):
     
     if user_role == 'tecnico':
         technician = db.users.find_one({'user_id': ObjectId(current_user.id), 'role':'tecnico'})
-        if str(task['technician_id']) != str(technician['_id']):
+        if task['technician_id'] != technician['_id']:
             return "No autorizado", 403
     
     # Actualizar tarea
@@ -573,8 +670,10 @@ def actualizar_tarea(order_id):
         {'$set': update_data}
     )
     
-    # Actualizar estado de la orden
-    update_order_status(task['order_id'])
+    # Actualizar estado de la orden y el resumen diario
+    change = (normalize_task_status(task.get('status')), normalize_task_status(status))
+    record_changes(task_changes(task, *change))
+    apply_order_task_changes(task['order_id'], [change])
     
     flash("Tarea actualizada correctamente", "success")
     return redirect(url_for('detalle_orden', order_id=str(task['order_id'])))
@@ -616,82 +715,18 @@ def ordenes_cliente(client_id):
     return render_template('ordenes/cliente.html', ordenes=ordenes)
 
 # Funciones auxiliares
-def update_order_status(order_id):
-    """Actualiza el estado de una orden basado en sus tareas"""
-    # Obtener todas las tareas de la orden
-    tasks = list(db.service_tasks.find({'order_id': order_id}))
-    
-    if not tasks:
-        # Si no hay tareas, el estado es "pending"
-        db.service_orders.update_one(
-            {'_id': order_id},
-            {'$set': {'status': 'pending'}}
-        )
-        cache.delete('admin_stats')
-
-        return
-    
-    # Determinar estado basado en tareas
-    all_completed = all(task['status'] == 'completed' for task in tasks)
-    has_in_progress = any(task['status'] == 'in_progress' for task in tasks)
-    has_pending = any(task['status'] == 'pending' for task in tasks)
-    
-    if all_completed:
-        new_status = 'completed'
-    elif has_in_progress:
-        new_status = 'in_progress'
-    else:
-        new_status = 'pending'
-    
-    # Actualizar orden
-    db.service_orders.update_one(
-        {'_id': order_id},
-        {'$set': {'status': new_status, 'updated_at': datetime.now()}}
-    )
-    cache.delete('admin_stats')
-
-
-def get_order_counters():
+def apply_order_task_changes(order_id, changes):
     """
-    Retorna los contadores para generar el número de orden:
-    - monthly_counter: reinicia cada mes
-    - yearly_counter: reinicia cada año
+    Aplica a los contadores de la orden los cambios de sus tareas, como pares
+    (estado_anterior, estado_nuevo) con None para tareas nuevas o borradas.
+    Una sola escritura; no relee las tareas.
     """
-    now = datetime.now()
-    year, month = now.year, now.month
-    counters = db.order_counters
-
-    # 1️⃣ Contador anual
-    # Crear documento si no existe
-    counters.update_one(
-        {'_id': f'year:{year}'},
-        {'$setOnInsert': {'year': year, 'yearly_counter': 0}},
-        upsert=True
-    )
-    # Incrementar
-    year_doc = counters.find_one_and_update(
-        {'_id': f'year:{year}'},
-        {'$inc': {'yearly_counter': 1}},
-        return_document=ReturnDocument.AFTER
-    )
-    yearly_counter = year_doc['yearly_counter']
-
-    # 2️⃣ Contador mensual
-    # Crear documento si no existe
-    counters.update_one(
-        {'_id': f'month:{year}-{month:02d}'},
-        {'$setOnInsert': {'year': year, 'month': month, 'monthly_counter': 0}},
-        upsert=True
-    )
-    # Incrementar
-    month_doc = counters.find_one_and_update(
-        {'_id': f'month:{year}-{month:02d}'},
-        {'$inc': {'monthly_counter': 1}},
-        return_document=ReturnDocument.AFTER
-    )
-    monthly_counter = month_doc['monthly_counter']
-
-    return monthly_counter, yearly_counter, year, month
+    deltas = task_deltas(changes)
+    if not deltas:
+        return
+    apply_task_deltas(order_id, deltas)
+    # Los dashboards muestran también tareas y técnicos, no solo el estado
+    bump_generation('orders')
 
 
 @ordenes_bp.route("/ordenes/detalles/<orden_id>")
@@ -701,8 +736,8 @@ def detalles_orden(orden_id):
     if not orden:
         return "<p class='text-danger'>Orden no encontrada</p>"
 
-    cliente = db.users.find_one({"_id": orden.get("cliente_id")})
-    tecnicos = list(db.users.find({"_id": {"$in": orden.get("tecnicos_ids", [])}}))
+    cliente = get_user(orden.get("cliente_id"))
+    tecnicos = list(load_users(orden.get("tecnicos_ids", [])).values())
 
     return render_template("ordenes/detalles_ordenes.html", orden=orden, cliente=cliente, tecnicos=tecnicos)
 
@@ -713,15 +748,11 @@ def actualizar_tareas_orden(order_id):
     if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
         return "No autorizado", 403
 
-    # 1) Eliminar tareas marcadas
+    # 1) Tareas marcadas para borrar
     delete_ids = request.form.getlist('delete_task_ids')
-    for tid in delete_ids:
-        try:
-            db.service_tasks.delete_one({'_id': ObjectId(tid)})
-        except:
-            continue
 
-    # 2) Actualizar tareas existentes
+    # 2) Ediciones de tareas existentes
+    updates = {}
     for key, value in request.form.items():
         if key.startswith('task-') and key.endswith('-desc'):
             task_id = key.split('-')[1]
@@ -750,53 +781,23 @@ def actualizar_tareas_orden(order_id):
 
             # Actualizar solo si hay cambios
             if len(update_data) > 2:  # Al menos un campo adicional además de descripción y timestamp
-                db.service_tasks.update_one(
-                    {'_id': ObjectId(task_id)},
-                    {'$set': update_data}
-                )
-
-    # 3) Crear nuevas tareas (código original)
-        # Insertar técnico "Sin asignar" si no existe
-    if not db.users.find_one({'name': 'Sin asignar', 'role': 'tecnico'}):
-        db.users.insert_one({
-            'name': 'Sin asignar',
-            'role': 'tecnico',
-            'is_active': True,
-        # ... otros campos requeridos
-    })
+                updates[task_id] = update_data
+
+    # 3) Tareas nuevas (sin técnico -> "Sin asignar")
+    new_tasks = []
     for key, value in request.form.items():
         if key.startswith('new-task-') and key.endswith('-desc'):
-            desc = value
-            tech = request.form.get(key.replace('-desc', '-tech'))
-            if desc:  # Solo verificamos que haya descripción
-                # Usar técnico "Sin asignar" si no se seleccionó
-                if not tech:
-                    # Buscar técnico "Sin asignar"
-                    default_tech = db.users.find_one({
-                        'name': 'Sin asignar',
-                        'role': 'tecnico',
-                        'is_active': True
-                    })
-                    if default_tech:
-                        tech = str(default_tech['_id'])
-                    else:
-                        flash("⚠️ Técnico 'Sin asignar' no encontrado", "warning")
-                        continue
-                
-                # Insertar tarea
-                db.service_tasks.insert_one({
-                    'order_id': ObjectId(order_id),
-                    'technician_id': ObjectId(tech),
-                    'description': desc,
-                    'status': 'pending',
-                    'observations': '',
-                    'start_time': None,
-                    'end_time': None,
-                    'created_at': datetime.now()
-                })
-
-    # Actualizar estado general de la orden
-    update_order_status(ObjectId(order_id))
+            if value:  # Solo verificamos que haya descripción
+                new_tasks.append((value, request.form.get(key.replace('-desc', '-tech')) or None))
+
+    # Todo en un bulk_write (en transacción si el despliegue lo permite) y una escritura de la orden
+    old_status, new_status, skipped = save_order_tasks(
+        order_id, delete_ids, updates, new_tasks,
+        use_transaction=current_app.config.get('MONGO_TRANSACTIONS', True)
+    )
+    if skipped:
+        flash("⚠️ Técnico 'Sin asignar' no encontrado", "warning")
+    bump_generation('orders')
 
     flash("Tareas actualizadas correctamente", "success")
     from_page = request.args.get("from_page") or request.form.get("from_page")
@@ -816,10 +817,14 @@ def reasignar_vendedor(order_id):
         return redirect(url_for('ordenes.detalle_orden', order_id=order_id))
 
     try:
-        db.service_orders.update_one(
+        before = db.service_orders.find_one_and_update(
             {"_id": ObjectId(order_id)},
-            {"$set": {"assigned_vendor_id": ObjectId(vendor_id)}}
+            {"$set": {"assigned_vendor_id": ObjectId(vendor_id)}},
+            projection={'status': 1, 'created_at': 1, 'assigned_vendor_id': 1, 'is_active': 1}
         )
+        if before:
+            record_changes(vendor_changes(before, ObjectId(vendor_id)))
+            bump_generation('orders')
         flash("Vendedor asignado correctamente", "success")
     except Exception as e:
         flash(f"Error al asignar vendedor: {str(e)}", "danger")
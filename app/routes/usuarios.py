@@ -1,13 +1,22 @@
-from flask import Blueprint, request, redirect, url_for, flash, render_template
+from flask import Blueprint, request, redirect, url_for, flash, render_template, jsonify
 from flask_login import current_user, login_required
 from app._init_ import mongo
 from datetime import datetime
 from bson import ObjectId
 from app._init_ import db
 from werkzeug.security import generate_password_hash
+from app.services.generations import CACHE_DOMAINS, bump_generation
+from app.services.pagination import keyset_page
+from app.services.principals import invalidate_principal
+from app.services.rollups import DAILY_STATS, rebuild_stats
+from app.services.rosters import get_roster, invalidate_roster
+from app.services.search import name_tokens, search_clients
 
 usuarios_bp = Blueprint('usuarios', __name__)
 
+CLIENT_SEARCH_LIMIT = 10
+CLIENT_SEARCH_MAX_LIMIT = 25
+
 #@usuarios_bp.route('/registro/', methods=['GET', 'POST'])
 @usuarios_bp.route('/registro/<rol>', methods=['GET', 'POST'])
 @login_required
@@ -29,6 +38,7 @@ def registro(rol=None):
         if editing and user_id:
             data_update = {
                 "name": name,
+                "name_tokens": name_tokens(name),
                 "cedula": cedula,
                 "phone": phone,
                 "address": address,
@@ -42,6 +52,8 @@ def registro(rol=None):
                 {'_id': ObjectId(user_id)},
                 {'$set': data_update}
             )
+            invalidate_roster(rol)
+            invalidate_principal(user_id)
 
             flash("Usuario actualizado correctamente", "success")
             # Redirigimos según el rol
@@ -76,6 +88,7 @@ def registro(rol=None):
 
         user_data = {
             'name': name,
+            'name_tokens': name_tokens(name),
             'cedula': cedula,
             'phone': phone,
             'address': address,
@@ -93,6 +106,7 @@ def registro(rol=None):
             user_data['especialidad'] = specialty
 
         db.users.insert_one(user_data)
+        invalidate_roster(role)
         flash("Usuario registrado correctamente", "success")
 
         # Redirección nueva
@@ -159,7 +173,7 @@ def list_tecnicos():
     if current_user.role not in ['supervisor', 'administrador']:
         return "No autorizado", 403
         
-    tecnicos = list(db.users.find({'role': 'tecnico', 'is_active': True}))
+    tecnicos = get_roster('tecnico', detail=True)
     
     return render_template('usuarios/tecnicos.html', tecnicos=tecnicos)
 
@@ -177,21 +191,35 @@ def list_clientes():
     if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
         return "No autorizado", 403
         
-    page = int(request.args.get('page', 1))
     per_page = 20
-    skip = (page - 1) * per_page
-
-    clientes = list(
-        db.users.find({'role': 'cliente', 'is_active': True})
-        .sort('name', 1)
-        .skip(skip)
-        .limit(per_page)
+    clientes, next_cursor, prev_cursor = keyset_page(
+        db.users, {'role': 'cliente', 'is_active': True}, 'name', 1,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=per_page
     )
     
     return render_template('usuarios/clientes.html', clientes=clientes,
-                       page=page,
+                       next_cursor=next_cursor,
+                       prev_cursor=prev_cursor,
                        per_page=per_page)
 
+@usuarios_bp.route('/clientes/buscar')
+@login_required
+def buscar_clientes():
+    """Autocompletado de clientes por prefijo de nombre o cédula (JSON)."""
+    if current_user.role not in ['supervisor', 'administrador', 'vendedor']:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    limit = request.args.get('limit', CLIENT_SEARCH_LIMIT, type=int)
+    limit = max(1, min(limit, CLIENT_SEARCH_MAX_LIMIT))
+    clientes = search_clients(request.args.get('q', ''), limit=limit)
+
+    return jsonify([
+        {'_id': str(c['_id']), 'name': c['name'], 'cedula': c['cedula']}
+        for c in clientes
+    ])
+
 @usuarios_bp.route('/nuevo/cliente')
 @login_required
 def nuevo_cliente():
@@ -243,6 +271,8 @@ def eliminar_usuario(user_id):
             {'_id': ObjectId(user_id)},
             {'$set': {'is_active': False}}
         )
+        invalidate_roster(user.get('role'))
+        invalidate_principal(user_id)
         
         # Redirigir según el rol del usuario eliminado
         if user['role'] == 'cliente':
@@ -285,6 +315,7 @@ def reset_password(user_id):
                 'password_changed': False,
             }}
         )
+        invalidate_principal(user_id)
         
         flash(f"Contraseña de {user['name']} reseteada a su cédula", "success")
         
@@ -327,10 +358,16 @@ def borrar_tablas():
             # Borrar cada colección seleccionada
             for col in selected:
                 db[col].delete_many({})  # Borra todos los documentos
+            # El resumen diario se recalcula con lo que queda
+            if {'service_orders', 'service_tasks'} & set(selected) and DAILY_STATS not in selected:
+                rebuild_stats()
+            bump_generation(*CACHE_DOMAINS)
             
             flash(f"Tablas borradas: {', '.join(selected)}", "success")
             # Si borró users, enviar al home para que se cree el primer admin
             if 'users' in selected:
+                invalidate_principal()
+                invalidate_roster()
                 return redirect(url_for('home'))  # o url_for('registro')            
             
             return redirect(url_for('dashboard.administrador_dashboard'))
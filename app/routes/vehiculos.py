@@ -3,7 +3,12 @@ from flask_login import current_user, login_required
 from app._init_ import mongo
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from app._init_ import db
+from app.services.generations import bump_generation
+from app.services.loaders import get_user, get_vehicle, load_users
+from app.services.pagination import keyset_page
+from app.services.search import normalize_plate
 
 vehiculos_bp = Blueprint('vehiculos', __name__)
 
@@ -35,17 +40,17 @@ def list_vehiculos():
         return "No autorizado", 403
     
     # Obtener vehículos
-    page = int(request.args.get('page', 1))
     per_page = 20
-    skip = (page - 1) * per_page
-
-    vehiculos = list(
-        db.vehicles.find({'is_active': True})
-        .sort('plate', 1)
-        .skip(skip)
-        .limit(per_page)
+    vehiculos, next_cursor, prev_cursor = keyset_page(
+        db.vehicles, {'is_active': True}, 'plate', 1,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=per_page
     )
-    # Preparar datos para el template
+    # Preparar datos para el template (clientes de toda la página en un $in)
+    clientes = load_users([
+        rel.get('client_id') for v in vehiculos for rel in v.get('relations', []) if rel.get('is_active', False)
+    ])
     for vehiculo in vehiculos:
         # Obtener todas las relaciones activas
         active_relations = [
@@ -57,11 +62,8 @@ def list_vehiculos():
         relations_info = []
         for rel in active_relations:
             # Buscar cliente en la colección unificada de usuarios
-            client = db.users.find_one({
-                '_id': rel['client_id'],
-                'role': 'cliente'  # Filtrar por rol cliente
-            })
-            if client:
+            client = clientes.get(rel['client_id'])
+            if client and client.get('role') == 'cliente':  # Filtrar por rol cliente
                 relations_info.append({
                     'type': rel['relation_type'],
                     'name': client.get('name', 'Sin nombre')  # El nombre está en el usuario
@@ -71,7 +73,8 @@ def list_vehiculos():
         vehiculo['relations_info'] = relations_info
     
     return render_template('vehiculos/vehiculos.html', vehiculos=vehiculos,
-                       page=page,
+                       next_cursor=next_cursor,
+                       prev_cursor=prev_cursor,
                        per_page=per_page)
 
 @vehiculos_bp.route('/nuevo', methods=['GET', 'POST'])
@@ -91,10 +94,14 @@ def nuevo_vehiculo():
         # Obtener datos de relaciones
         client_id = request.form.get('client_id')
         relation_type = request.form.get('relation_type')
+        if not ObjectId.is_valid(client_id or ''):
+            flash("Seleccione un cliente de la lista", "danger")
+            return redirect(url_for('vehiculos.nuevo_vehiculo'))
         
         # Crear documento de vehículo
         vehicle = {
             "plate": plate,
+            "plate_key": normalize_plate(plate),
             "make": make,
             "model": model,
             "year": year,
@@ -110,27 +117,33 @@ def nuevo_vehiculo():
             ]
         }
         
-        # Insertar en la base de datos
-        db.vehicles.insert_one(vehicle)
+        # Insertar en la base de datos (plate y plate_key son únicos)
+        try:
+            db.vehicles.insert_one(vehicle)
+        except DuplicateKeyError:
+            flash("Placa ya registrada", "danger")
+            return redirect(url_for('vehiculos.nuevo_vehiculo'))
+        bump_generation('vehicles')
         
         flash("Vehículo registrado correctamente", "success")
         return redirect(url_for('vehiculos.list_vehiculos'))
     
-    # GET: mostrar formulario
-    clientes = list(db.users.find({'role': 'cliente'}))
-    return render_template('vehiculos/nuevo_vehiculo.html', clientes=clientes)
+    # GET: mostrar formulario (los clientes se buscan con usuarios.buscar_clientes)
+    return render_template('vehiculos/nuevo_vehiculo.html')
 
 @vehiculos_bp.route("/vehiculos/<vehicle_id>")
 @login_required
 def ver_vehiculo(vehicle_id):
-    vehiculo = db.vehicles.find_one({"_id": ObjectId(vehicle_id)})
+    vehiculo = get_vehicle(ObjectId(vehicle_id))
     if not vehiculo:
         flash("Vehículo no encontrado", "danger")
         return redirect(url_for("vehiculos.list_vehiculos"))
 
+    ordenes_vehiculo = list(db.service_orders.find({"vehicle_id": ObjectId(vehicle_id)}))
+    clientes = load_users([o.get("client_id") for o in ordenes_vehiculo])
     ordenes = []
-    for orden in db.service_orders.find({"vehicle_id": ObjectId(vehicle_id)}):  # 👈 aquí la corrección
-        cliente = db.users.find_one({"_id": orden.get("client_id")})  # 👈 en tu código era cliente_id
+    for orden in ordenes_vehiculo:
+        cliente = clientes.get(orden.get("client_id"))
         ordenes.append({
             **orden,
             "cliente": cliente["name"] if cliente else "No asignado"
@@ -167,18 +180,25 @@ def editar_vehiculo(vehicle_id):
         color = request.form.get('color')
         client_id = request.form.get('client_id')
         relation_type = request.form.get('relation_type')
+        if client_id and not ObjectId.is_valid(client_id):
+            client_id = None
         
-        # Actualizar datos básicos
-        db.vehicles.update_one(
-            {'_id': ObjectId(vehicle_id)},
-            {'$set': {
-                'plate': plate,
-                'make': make,
-                'model': model,
-                'year': year,
-                'color': color
-            }}
-        )
+        # Actualizar datos básicos (plate y plate_key son únicos)
+        try:
+            db.vehicles.update_one(
+                {'_id': ObjectId(vehicle_id)},
+                {'$set': {
+                    'plate': plate,
+                    'plate_key': normalize_plate(plate),
+                    'make': make,
+                    'model': model,
+                    'year': year,
+                    'color': color
+                }}
+            )
+        except DuplicateKeyError:
+            flash("Placa ya registrada", "danger")
+            return redirect(url_for('vehiculos.editar_vehiculo', vehicle_id=vehicle_id, next=next_url))
         
         if client_id:
             # Buscar órdenes con el mismo vehicle_id y client_id = null
@@ -190,6 +210,8 @@ def editar_vehiculo(vehicle_id):
             # Actualizar cada orden
             for order in orders:
                 update_order_registration_status(order['_id'], client_id)
+            if orders:
+                bump_generation('orders')
             
             # Crear nueva relación
             new_relation = {
@@ -208,7 +230,7 @@ def editar_vehiculo(vehicle_id):
                 # Buscar si ya existe una relación con este cliente
                 relation_updated = False
                 for relation in vehicle['relations']:
-                    if str(relation['client_id']) == client_id:
+                    if relation['client_id'] == ObjectId(client_id):
                         relation['is_active'] = True
                         relation['relation_type'] = relation_type
                         relation['start_date'] = datetime.now()
@@ -231,15 +253,18 @@ def editar_vehiculo(vehicle_id):
                     {'$set': {'relations': [new_relation]}}
                 )
         
+        bump_generation('vehicles')
         flash("Vehículo actualizado correctamente", "success")
         return redirect(next_url)
     
-    # GET: mostrar formulario
-    clientes = list(db.users.find({'role': 'cliente'}))
+    # GET: mostrar formulario; solo se carga el cliente actual para prellenar el buscador
+    current_client = None
+    if current_relation:
+        current_client = get_user(current_relation['client_id'])
     return render_template('vehiculos/editar_vehiculo.html', 
                           vehiculo=vehicle, 
                           current_relation=current_relation,
-                          clientes=clientes)
+                          current_client=current_client)
 
 @vehiculos_bp.route('/eliminar/<vehicle_id>')
 @login_required
@@ -251,13 +276,14 @@ def eliminar_vehiculo(vehicle_id):
         {'_id': ObjectId(vehicle_id)},
         {'$set': {'is_active': False}}
     )
+    bump_generation('vehicles')
     return redirect(url_for('vehiculos.list_vehiculos'))
 
 @vehiculos_bp.route('/get-clients/<vehicle_id>')
 @login_required
 def get_vehicle_clients(vehicle_id):
     try:
-        vehicle = db.vehicles.find_one({'_id': ObjectId(vehicle_id)})
+        vehicle = get_vehicle(ObjectId(vehicle_id))
         if not vehicle:
             return jsonify([])
         # Obtener relaciones del vehículo
@@ -268,8 +294,9 @@ def get_vehicle_clients(vehicle_id):
         
         # Construir lista de clientes
         clients = []
+        users = load_users([rel['client_id'] for rel in active_relations])
         for rel in active_relations:
-            client = db.users.find_one({'_id': rel['client_id']})
+            client = users.get(rel['client_id'])
             if client:
                 clients.append({
                     '_id': str(client['_id']),
@@ -293,12 +320,12 @@ def detalle_orden(order_id):
     # Buscar cliente
     cliente = None
     if orden.get("client_id"):
-        cliente = db.users.find_one({"_id": orden["client_id"]})
+        cliente = get_user(orden["client_id"])
 
     # Buscar vehículo
     vehiculo = None
     if orden.get("vehicle_id"):
-        vehiculo = db.vehicles.find_one({"_id": orden["vehicle_id"]})
+        vehiculo = get_vehicle(orden["vehicle_id"])
 
     # Renderizar un fragmento HTML para el modal
     return render_template("ordenes/detalles_ordenes.html", 
@@ -0,0 +1,82 @@
+import os
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument
+from app import extensions
+
+
+def _reserve(year, month, count):
+    """
+    Reserva `count` números en un solo viaje a MongoDB.
+
+    Los contadores anual y mensual viven en el mismo documento
+    (`order_counters`, _id 'year:YYYY', campo `months.MM`), así que ambos se
+    incrementan de forma atómica con un único find_one_and_update.
+    Devuelve los últimos valores reservados (monthly, yearly).
+    """
+    month_key = f'{month:02d}'
+    doc = extensions.db.order_counters.find_one_and_update(
+        {'_id': f'year:{year}'},
+        {
+            '$inc': {'yearly_counter': count, f'months.{month_key}': count},
+            '$setOnInsert': {'year': year},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc['months'][month_key], doc['yearly_counter']
+
+
+class OrderNumberAllocator:
+    """
+    Asigna contadores de orden. Con block_size > 1 cada proceso reserva un
+    bloque de números de una vez y los entrega desde memoria, de modo que
+    varias altas seguidas no compiten por el mismo documento.
+
+    Los números de un bloque no usados se pierden si el proceso termina o si
+    cambia el mes; con block_size=1 (por defecto) no hay huecos.
+    """
+
+    def __init__(self, block_size=1):
+        self.block_size = max(1, int(block_size))
+        self._lock = threading.Lock()
+        self._block = None   # (pid, year, month, next_monthly, next_yearly, remaining)
+
+    def next(self, now=None):
+        now = now or datetime.now()
+        year, month = now.year, now.month
+        with self._lock:
+            block = self._block
+            # Un bloque heredado tras un fork o de otro mes no se reutiliza
+            if (block is None or block[0] != os.getpid() or block[1:3] != (year, month)
+                    or block[5] <= 0):
+                last_monthly, last_yearly = _reserve(year, month, self.block_size)
+                block = (os.getpid(), year, month,
+                         last_monthly - self.block_size + 1,
+                         last_yearly - self.block_size + 1,
+                         self.block_size)
+            pid, year, month, monthly, yearly, remaining = block
+            self._block = (pid, year, month, monthly + 1, yearly + 1, remaining - 1)
+        return monthly, yearly, year, month
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_order_counters(block_size=1):
+    """
+    Retorna (monthly_counter, yearly_counter, year, month) para el número de orden:
+    - monthly_counter: reinicia cada mes
+    - yearly_counter: reinicia cada año
+    """
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None or _allocator.block_size != max(1, int(block_size)):
+            _allocator = OrderNumberAllocator(block_size)
+        allocator = _allocator
+    return allocator.next()
+
+
+def format_order_number(monthly_counter, yearly_counter, year, month):
+    return f"ORD-{year}-{month:02d}-{monthly_counter:04d}-{yearly_counter:06d}"
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+
+EXPORT_COLUMNS = [
+    ('order_number', 'Número'),
+    ('created_at', 'Fecha'),
+    ('status', 'Estado'),
+    ('registration_status', 'Registro'),
+    ('client_name', 'Cliente'),
+    ('vehicle_plate', 'Placa'),
+    ('vehicle_make', 'Marca'),
+    ('vehicle_model', 'Modelo'),
+    ('technicians', 'Técnicos'),
+    ('description', 'Descripción'),
+]
+
+
+def _batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_rows(cursor, populate, batch_size=500):
+    """
+    Recorre el cursor por lotes, resuelve las relaciones de cada lote con
+    `populate` y entrega una fila plana por orden. Solo hay un lote en memoria.
+    """
+    for batch in _batches(cursor, batch_size):
+        for order in populate(batch):
+            technicians = []
+            for task in order.get('tasks', []):
+                if task['technician_name'] not in technicians:
+                    technicians.append(task['technician_name'])
+            created_at = order.get('created_at')
+            yield {
+                'order_number': order.get('order_number', ''),
+                'created_at': created_at.strftime('%Y-%m-%d %H:%M') if created_at else '',
+                'status': order.get('status', ''),
+                'registration_status': order.get('registration_status', ''),
+                'client_name': order.get('client_name', ''),
+                'vehicle_plate': order.get('vehicle_plate', ''),
+                'vehicle_make': order.get('vehicle_make', ''),
+                'vehicle_model': order.get('vehicle_model', ''),
+                'technicians': ', '.join(technicians),
+                'description': order.get('description', ''),
+            }
+
+
+def csv_stream(rows):
+    """Genera el CSV línea por línea (con BOM para que Excel respete los acentos)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow([label for _, label in EXPORT_COLUMNS])
+    yield '\ufeff' + flush()
+    for row in rows:
+        writer.writerow([row[key] for key, _ in EXPORT_COLUMNS])
+        yield flush()
+
+
+def ndjson_stream(rows):
+    """Genera un objeto JSON por línea."""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {'csv': csv_stream, 'ndjson': ndjson_stream}
+EXPORT_MIMETYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
@@ -0,0 +1,41 @@
+import time
+
+from app import extensions
+
+# Invalidación por generaciones
+#
+# Cada dominio de datos tiene un número de generación guardado en la cache
+# compartida. Cada valor cacheado guarda la generación de los dominios de
+# los que depende (ver app/services/refresh.py), así que al escribir basta
+# con incrementar la generación del dominio: en todos los workers el valor
+# pasa a estar vencido sin borrar claves una por una.
+CACHE_DOMAINS = ('orders', 'users', 'vehicles')
+
+
+def _generation_key(domain):
+    return f'generation:{domain}'
+
+
+def generation(domain):
+    """Generación actual de un dominio (se crea si la cache no la tiene)."""
+    key = _generation_key(domain)
+    value = extensions.cache.get(key)
+    if value is None:
+        # Semilla por reloj: si el backend descartó la clave, la nueva
+        # generación no coincide con ninguna anterior. `add` no pisa la
+        # semilla que haya puesto otro worker al mismo tiempo.
+        extensions.cache.add(key, int(time.time() * 1000), timeout=0)
+        value = extensions.cache.get(key)
+    return value
+
+
+def bump_generation(*domains):
+    """Invalida todos los valores cacheados que dependen de los dominios dados."""
+    for domain in domains:
+        if domain not in CACHE_DOMAINS:
+            raise ValueError(f'Dominio de cache desconocido: {domain}')
+        # Incremento atómico del backend (INCR en Redis): dos escrituras
+        # simultáneas dejan dos generaciones nuevas, y un valor calculado
+        # entre ambas queda vencido por la segunda
+        generation(domain)
+        extensions.cache.cache.inc(_generation_key(domain))
@@ -0,0 +1,144 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app import extensions
+
+# Registro de índices
+#
+# Todos los índices que necesitan las consultas de app/routes y app/services,
+# por colección. `flask db ensure-indexes` los crea (también al arrancar la
+# app, ver ENSURE_INDEXES en config.py) y `flask db verify-indexes` informa
+# los que faltan, los que existen con otras opciones, los que no están
+# declarados aquí y los que no se han usado desde el último arranque.
+#
+# Los índices parciales sobre {is_active: true} solo cubren documentos
+# activos: las consultas que los usan deben filtrar por is_active=True.
+
+ACTIVE = {'is_active': True}
+
+INDEXES = {
+    'users': [
+        # Login y registro (cédula única)
+        IndexModel([('cedula', ASCENDING)], unique=True),
+        # Conteo de técnicos y técnico 'Sin asignar'
+        IndexModel([('role', ASCENDING)]),
+        # Listas de personal y paginación de clientes por nombre
+        IndexModel([('role', ASCENDING), ('is_active', ASCENDING), ('name', ASCENDING), ('_id', ASCENDING)]),
+        # Búsqueda por prefijo de nombre y autocompletado por cédula
+        IndexModel([('role', ASCENDING), ('name_tokens', ASCENDING)],
+                   name='role_1_name_tokens_1_active', partialFilterExpression=ACTIVE),
+        IndexModel([('role', ASCENDING), ('cedula', ASCENDING)],
+                   name='role_1_cedula_1_active', partialFilterExpression=ACTIVE),
+    ],
+    'vehicles': [
+        # Placa única; también sirve a la paginación de la lista por (plate, _id)
+        IndexModel([('plate', ASCENDING)], unique=True),
+        # Búsqueda exacta y por prefijo de placa normalizada. Único: dos
+        # órdenes rápidas simultáneas no pueden crear el mismo vehículo. Parcial
+        # para no chocar con vehículos antiguos sin placa ('' o sin plate_key).
+        # En bases con el índice anterior (plate_key_1) hay que borrarlo y
+        # unificar placas duplicadas antes de `flask db ensure-indexes`.
+        IndexModel([('plate_key', ASCENDING)], name='plate_key_1_unique', unique=True,
+                   partialFilterExpression={'plate_key': {'$gt': ''}}),
+    ],
+    'service_orders': [
+        IndexModel([('order_number', ASCENDING)]),
+        # Lista de órdenes (paginación por cursor) y dashboards
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('is_active', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+        IndexModel([('client_id', ASCENDING)]),
+        IndexModel([('vehicle_id', ASCENDING)]),
+        # Filtro por técnico
+        IndexModel([('technician_ids', ASCENDING), ('created_at', DESCENDING)]),
+        # Órdenes recientes del vendedor (sus conteos salen de daily_stats)
+        IndexModel([('assigned_vendor_id', ASCENDING), ('created_at', DESCENDING)],
+                   name='assigned_vendor_id_1_created_at_-1_active', partialFilterExpression=ACTIVE),
+    ],
+    'service_tasks': [
+        IndexModel([('order_id', ASCENDING), ('technician_id', ASCENDING)]),
+        IndexModel([('status', ASCENDING)]),
+        # Productividad y carga de trabajo por período
+        IndexModel([('created_at', ASCENDING)]),
+        # Vistas del técnico
+        IndexModel([('technician_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+}
+
+# Opciones que deben coincidir para considerar un índice existente como el declarado
+_COMPARED_OPTIONS = ('unique', 'partialFilterExpression')
+
+
+def _spec(model):
+    doc = model.document
+    keys = tuple((field, int(direction)) for field, direction in doc['key'].items())
+    options = {opt: doc[opt] for opt in _COMPARED_OPTIONS if doc.get(opt)}
+    return keys, options
+
+
+def _existing(collection):
+    """{clave: (nombre, opciones)} de los índices existentes de una colección."""
+    result = {}
+    for name, info in extensions.db[collection].index_information().items():
+        keys = tuple((field, int(direction)) for field, direction in info['key'])
+        options = {opt: info[opt] for opt in _COMPARED_OPTIONS if info.get(opt)}
+        result[keys] = (name, options)
+    return result
+
+
+def ensure_indexes():
+    """
+    Crea los índices declarados que falten. Devuelve {colección: [nombres creados]}.
+    Un índice que ya existe con la misma clave y otras opciones no se toca
+    (ver verify_indexes).
+    """
+    created = {}
+    for collection, models in INDEXES.items():
+        existing = _existing(collection)
+        for model in models:
+            if _spec(model)[0] in existing:
+                continue
+            options = dict(model.document)
+            keys = list(options.pop('key').items())
+            name = extensions.db[collection].create_index(keys, **options)
+            created.setdefault(collection, []).append(name)
+    return created
+
+
+def _usage(collection):
+    """{nombre: operaciones desde el arranque}, o None si el servidor no lo informa."""
+    try:
+        return {
+            row['name']: row['accesses']['ops']
+            for row in extensions.db[collection].aggregate([{'$indexStats': {}}])
+        }
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+def verify_indexes():
+    """
+    Compara los índices existentes con el registro. Devuelve, por colección:
+    {'missing': [...], 'different': [...], 'undeclared': [...], 'unused': [...]}
+    con nombres de índice (los faltantes con su nombre declarado).
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = _existing(collection)
+        declared = set()
+        entry = {'missing': [], 'different': [], 'undeclared': [], 'unused': []}
+        for model in models:
+            keys, options = _spec(model)
+            declared.add(keys)
+            if keys not in existing:
+                entry['missing'].append(model.document['name'])
+            elif existing[keys][1] != options:
+                entry['different'].append(existing[keys][0])
+        for keys, (name, _) in existing.items():
+            if name != '_id_' and keys not in declared:
+                entry['undeclared'].append(name)
+        usage = _usage(collection)
+        if usage:
+            entry['unused'] = sorted(name for name, ops in usage.items() if name != '_id_' and not ops)
+        report[collection] = entry
+    return report
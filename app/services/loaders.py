@@ -0,0 +1,118 @@
+from bson import ObjectId
+from flask import g, has_app_context
+from app import extensions
+
+
+def _as_object_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except Exception:
+        return None
+
+
+def fetch_map(collection, ids, extra_filter=None, projection=None):
+    """
+    Carga en una sola consulta ($in) los documentos cuyos _id están en `ids`.
+    Devuelve un dict {_id: documento}. Ignora ids vacíos o inválidos.
+    """
+    unique_ids = []
+    seen = set()
+    for value in ids:
+        oid = _as_object_id(value) if value else None
+        if oid is not None and oid not in seen:
+            seen.add(oid)
+            unique_ids.append(oid)
+
+    if not unique_ids:
+        return {}
+
+    query = {'_id': {'$in': unique_ids}}
+    if extra_filter:
+        query.update(extra_filter)
+
+    return {doc['_id']: doc for doc in extensions.db[collection].find(query, projection)}
+
+
+def tasks_by_order(order_ids, projection=None):
+    """Agrupa las tareas de varias órdenes en un dict {order_id: [tareas]}."""
+    grouped = {oid: [] for oid in order_ids}
+    if not order_ids:
+        return grouped
+    cursor = extensions.db.service_tasks.find({'order_id': {'$in': list(order_ids)}}, projection)
+    for task in cursor:
+        grouped.setdefault(task['order_id'], []).append(task)
+    return grouped
+
+
+
+# Mapa de identidad por petición ---------------------------------------------
+
+class IdentityMap:
+    """
+    Documentos de una colección ya cargados durante la petición, por _id.
+
+    Las búsquedas se acumulan y se resuelven con un solo $in (fetch_map); cada
+    _id se consulta a lo sumo una vez por petición, exista o no. Los
+    documentos se guardan completos para que cualquier vista pueda usarlos.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._docs = {}
+        self._pending = set()
+
+    def prime(self, ids):
+        """Encola ids para cargarlos en la próxima consulta."""
+        for value in ids:
+            oid = _as_object_id(value) if value else None
+            if oid is not None and oid not in self._docs:
+                self._pending.add(oid)
+
+    def load_many(self, ids):
+        """{_id: documento} de los ids pedidos que existen (un $in para los nuevos)."""
+        ids = [oid for oid in (_as_object_id(v) if v else None for v in ids) if oid is not None]
+        self.prime(ids)
+        if self._pending:
+            found = fetch_map(self.collection, self._pending)
+            for oid in self._pending:
+                self._docs[oid] = found.get(oid)
+            self._pending = set()
+        return {oid: self._docs[oid] for oid in ids if self._docs.get(oid) is not None}
+
+    def get(self, value):
+        oid = _as_object_id(value) if value else None
+        if oid is None:
+            return None
+        return self.load_many([oid]).get(oid)
+
+    def forget(self, value):
+        """Descarta un documento (por ejemplo, tras modificarlo en la misma petición)."""
+        self._docs.pop(_as_object_id(value), None)
+
+
+def identity_map(collection):
+    """IdentityMap de la petición actual; fuera de contexto, uno nuevo sin memoria."""
+    if not has_app_context():
+        return IdentityMap(collection)
+    maps = g.setdefault('identity_maps', {})
+    if collection not in maps:
+        maps[collection] = IdentityMap(collection)
+    return maps[collection]
+
+
+def get_user(user_id):
+    return identity_map('users').get(user_id)
+
+
+def get_vehicle(vehicle_id):
+    return identity_map('vehicles').get(vehicle_id)
+
+
+def load_users(ids):
+    return identity_map('users').load_many(ids)
+
+
+def load_vehicles(ids):
+    return identity_map('vehicles').load_many(ids)
@@ -0,0 +1,282 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, InsertOne, UpdateOne, DeleteOne
+from app import extensions
+from app.services.rollups import order_changes, record_changes, task_changes
+from app.services.rosters import invalidate_roster
+from app.services.search import name_tokens
+
+
+def add_order_technician(order_id, technician_id):
+    """Agrega un técnico a `service_orders.technician_ids` (sin duplicados)."""
+    extensions.db.service_orders.update_one(
+        {'_id': ObjectId(order_id)},
+        {'$addToSet': {'technician_ids': ObjectId(technician_id)}}
+    )
+
+
+# Contadores de tareas por estado -------------------------------------------
+
+TASK_STATUSES = ('pending', 'in_progress', 'completed')
+
+
+def normalize_task_status(status):
+    """Lleva cualquier estado de tarea a uno de TASK_STATUSES (desconocido -> pending)."""
+    return status if status in TASK_STATUSES else 'pending'
+
+
+def derive_order_status(counts):
+    """
+    Estado de la orden a partir de sus contadores:
+    todas completadas -> completed; alguna en progreso -> in_progress; si no -> pending.
+    """
+    total = sum(counts.get(s, 0) for s in TASK_STATUSES)
+    if total and counts.get('completed', 0) == total:
+        return 'completed'
+    if counts.get('in_progress', 0) > 0:
+        return 'in_progress'
+    return 'pending'
+
+
+def _status_expression():
+    """Misma regla que derive_order_status, como expresión de agregación."""
+    counts = {s: {'$ifNull': [f'$task_counts.{s}', 0]} for s in TASK_STATUSES}
+    total = {'$add': list(counts.values())}
+    return {'$switch': {
+        'branches': [
+            {'case': {'$and': [{'$gt': [total, 0]}, {'$eq': [counts['completed'], total]}]},
+             'then': 'completed'},
+            {'case': {'$gt': [counts['in_progress'], 0]}, 'then': 'in_progress'},
+        ],
+        'default': 'pending',
+    }}
+
+
+# Campos de la orden que necesita el resumen diario al cambiar de estado
+_ROLLUP_PROJECTION = {'status': 1, 'created_at': 1, 'assigned_vendor_id': 1, 'is_active': 1}
+
+
+def _record_status_change(before, new_status, session=None):
+    """Mueve la orden de estado en `daily_stats` si está activa y el estado cambió."""
+    old_status = normalize_task_status(before.get('status'))
+    if before.get('is_active') and old_status != new_status:
+        record_changes(order_changes(before, old_status, new_status), session=session)
+
+
+def task_deltas(changes):
+    """
+    Convierte una lista de (estado_anterior, estado_nuevo) en incrementos por estado.
+    Use None como estado anterior para tareas nuevas y como nuevo para borradas.
+    """
+    deltas = {}
+    for old, new in changes:
+        if old is not None:
+            old = normalize_task_status(old)
+            deltas[old] = deltas.get(old, 0) - 1
+        if new is not None:
+            new = normalize_task_status(new)
+            deltas[new] = deltas.get(new, 0) + 1
+    return {s: d for s, d in deltas.items() if d}
+
+
+def apply_task_deltas(order_id, deltas, extra_set=None, session=None):
+    """
+    Ajusta `task_counts` de la orden y recalcula su `status` en una sola
+    escritura (update con pipeline), sin leer las tareas. `extra_set` agrega
+    otros campos a la misma escritura.
+
+    Devuelve (estado_anterior, estado_nuevo). Si la orden aún no tenía
+    contadores, se recalculan desde las tareas (recount_order_tasks). Los
+    cambios de estado se reflejan también en el resumen diario.
+    """
+    order_id = ObjectId(order_id)
+    extra = {k: {'$literal': v} for k, v in (extra_set or {}).items()}
+    pipeline = [
+        {'$set': {
+            f'task_counts.{s}': {'$add': [{'$ifNull': [f'$task_counts.{s}', 0]}, deltas.get(s, 0)]}
+            for s in TASK_STATUSES
+        }},
+        {'$set': dict(extra, status=_status_expression(), updated_at=datetime.now())},
+    ]
+    before = extensions.db.service_orders.find_one_and_update(
+        {'_id': order_id, 'task_counts': {'$exists': True}},
+        pipeline,
+        projection=dict(_ROLLUP_PROJECTION, task_counts=1),
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None:
+        # Orden sin contadores (anterior a este cambio) o inexistente
+        old = extensions.db.service_orders.find_one({'_id': order_id}, {'status': 1}, session=session)
+        if old is None:
+            return None, None
+        if extra_set:
+            extensions.db.service_orders.update_one({'_id': order_id}, {'$set': extra_set}, session=session)
+        return old.get('status'), recount_order_tasks(order_id, session=session)
+
+    counts = dict(before.get('task_counts') or {})
+    for s, d in deltas.items():
+        counts[s] = counts.get(s, 0) + d
+    new_status = derive_order_status(counts)
+    _record_status_change(before, new_status, session=session)
+    return before.get('status'), new_status
+
+
+def recount_order_tasks(order_id, session=None):
+    """Recalcula desde cero `task_counts` y `status` de una orden. Devuelve el estado."""
+    order_id = ObjectId(order_id)
+    counts = {s: 0 for s in TASK_STATUSES}
+    for row in extensions.db.service_tasks.aggregate([
+        {'$match': {'order_id': order_id}},
+        {'$group': {'_id': '$status', 'count': {'$sum': 1}}},
+    ], session=session):
+        counts[normalize_task_status(row['_id'])] += row['count']
+    status = derive_order_status(counts)
+    before = extensions.db.service_orders.find_one_and_update(
+        {'_id': order_id},
+        {'$set': {'task_counts': counts, 'status': status, 'updated_at': datetime.now()}},
+        projection=_ROLLUP_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is not None:
+        _record_status_change(before, status, session=session)
+    return status
+
+
+# Guardado del formulario de tareas -----------------------------------------
+
+UNASSIGNED_TECHNICIAN = 'Sin asignar'
+
+
+def get_unassigned_technician(session=None):
+    """Técnico 'Sin asignar' (se crea si no existe) en un solo viaje."""
+    query = {'name': UNASSIGNED_TECHNICIAN, 'role': 'tecnico'}
+    before = extensions.db.users.find_one_and_update(
+        query,
+        {'$setOnInsert': {'is_active': True, 'name_tokens': name_tokens(UNASSIGNED_TECHNICIAN)}},
+        projection={'is_active': 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is not None:
+        return before
+    # Recién creado: la lista de técnicos cambió
+    invalidate_roster('tecnico')
+    return extensions.db.users.find_one(query, {'is_active': 1}, session=session)
+
+
+def supports_transactions(client):
+    """Las transacciones requieren un replica set o un clúster fragmentado."""
+    try:
+        return client.topology_description.topology_type_name in ('ReplicaSetWithPrimary', 'Sharded')
+    except AttributeError:
+        return False
+
+
+def save_order_tasks(order_id, delete_ids, updates, new_tasks, use_transaction=True):
+    """
+    Aplica en bloque las ediciones del formulario de tareas de una orden:
+
+    - delete_ids: ids de tareas a borrar
+    - updates: {task_id: campos a $set}
+    - new_tasks: lista de (descripción, technician_id o None para 'Sin asignar')
+
+    Lee una vez las tareas de la orden, envía todo en un único bulk_write
+    ordenado y termina con una sola escritura de la orden (technician_ids,
+    task_counts y status) y una del resumen diario. Si el despliegue lo
+    permite, todo va en una transacción.
+
+    Devuelve (estado_anterior, estado_nuevo, tareas_nuevas_omitidas).
+    """
+    order_id = ObjectId(order_id)
+    client = extensions.db.client
+
+    def run(session):
+        existing = {
+            t['_id']: t for t in extensions.db.service_tasks.find(
+                {'order_id': order_id}, {'status': 1, 'technician_id': 1, 'created_at': 1}, session=session
+            )
+        }
+        ops, changes, rollup, skipped = [], [], [], 0
+
+        # 1) Borrados (solo tareas de esta orden)
+        for tid in delete_ids:
+            try:
+                tid = ObjectId(tid)
+            except Exception:
+                continue
+            task = existing.pop(tid, None)
+            if task is not None:
+                ops.append(DeleteOne({'_id': tid}))
+                changes.append((normalize_task_status(task.get('status')), None))
+                rollup += task_changes(task, normalize_task_status(task.get('status')), None)
+
+        # 2) Ediciones
+        for tid, data in updates.items():
+            try:
+                tid = ObjectId(tid)
+            except Exception:
+                continue
+            task = existing.get(tid)
+            if task is None:
+                continue
+            ops.append(UpdateOne({'_id': tid}, {'$set': data}))
+            old = normalize_task_status(task.get('status'))
+            new = normalize_task_status(data['status']) if 'status' in data else old
+            if 'status' in data:
+                changes.append((old, new))
+            if 'technician_id' in data and data['technician_id'] != task.get('technician_id'):
+                # Reasignada: sale del resumen del técnico anterior y entra en el nuevo
+                rollup += task_changes(task, old, None)
+                task['technician_id'] = data['technician_id']
+                rollup += task_changes(task, None, new)
+            else:
+                rollup += task_changes(task, old, new)
+            task['status'] = new
+
+        # 3) Tareas nuevas
+        technician_ids = [t.get('technician_id') for t in existing.values()]
+        default_tech = None
+        for desc, tech in new_tasks:
+            if not tech:
+                if default_tech is None:
+                    default_tech = get_unassigned_technician(session) or {}
+                if not default_tech.get('is_active'):
+                    skipped += 1
+                    continue
+                tech = default_tech['_id']
+            tech = ObjectId(tech)
+            task = {
+                'order_id': order_id,
+                'technician_id': tech,
+                'description': desc,
+                'status': 'pending',
+                'observations': '',
+                'start_time': None,
+                'end_time': None,
+                'created_at': datetime.now()
+            }
+            ops.append(InsertOne(task))
+            technician_ids.append(tech)
+            changes.append((None, 'pending'))
+            rollup += task_changes(task, None, 'pending')
+
+        if ops:
+            extensions.db.service_tasks.bulk_write(ops, ordered=True, session=session)
+            record_changes(rollup, session=session)
+
+        unique_techs = []
+        for tid in technician_ids:
+            if tid is not None and tid not in unique_techs:
+                unique_techs.append(tid)
+        old_status, new_status = apply_task_deltas(
+            order_id, task_deltas(changes), {'technician_ids': unique_techs}, session=session
+        )
+        return old_status, new_status, skipped
+
+    if use_transaction and supports_transactions(client):
+        with client.start_session() as session:
+            return session.with_transaction(run)
+    return run(None)
@@ -0,0 +1,123 @@
+import base64
+from bson import json_util
+
+
+def encode_cursor(value, _id):
+    """Codifica (valor de orden, _id) en un cursor opaco apto para URL."""
+    raw = json_util.dumps([value, _id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decodifica un cursor generado por encode_cursor. Devuelve None si es inválido."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, _id = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return value, _id
+    except (ValueError, TypeError):
+        return None
+
+
+def _cursor_condition(field, value, _id, ascending):
+    """Condición para los documentos estrictamente posteriores a (value, _id)."""
+    op = '$gt' if ascending else '$lt'
+    if value is None:
+        # Los valores nulos van primero en orden ascendente y al final en descendente
+        tie = {field: None, '_id': {op: _id}}
+        return {'$or': [tie, {field: {'$ne': None}}]} if ascending else tie
+    clauses = [
+        {field: {op: value}},
+        {field: value, '_id': {op: _id}},
+    ]
+    if not ascending:
+        clauses.append({field: None})
+    return {'$or': clauses}
+
+
+class _KeysetPlan:
+    """Condición, orden y sentido de recorrido para una página keyset."""
+
+    def __init__(self, field, direction, after, before):
+        self.field = field
+        self.cursor = decode_cursor(before) if before else decode_cursor(after)
+        self.backwards = bool(before) and self.cursor is not None
+        # Al retroceder se recorre en sentido inverso y luego se invierte el resultado
+        scan_ascending = (direction == 1) != self.backwards
+        self.scan_dir = 1 if scan_ascending else -1
+        self.condition = None
+        if self.cursor is not None:
+            self.condition = _cursor_condition(field, self.cursor[0], self.cursor[1], scan_ascending)
+
+    @property
+    def sort(self):
+        return [(self.field, self.scan_dir), ('_id', self.scan_dir)]
+
+    def apply(self, query):
+        return {'$and': [query, self.condition]} if self.condition else query
+
+    def finish(self, docs, per_page):
+        """Recorta la página y calcula (documentos, cursor_siguiente, cursor_anterior)."""
+        has_more = len(docs) > per_page
+        docs = docs[:per_page]
+        if self.backwards:
+            docs.reverse()
+
+        if not docs:
+            return docs, None, None
+
+        first, last = docs[0], docs[-1]
+        first_cursor = encode_cursor(first.get(self.field), first['_id'])
+        last_cursor = encode_cursor(last.get(self.field), last['_id'])
+
+        if self.backwards:
+            next_cursor = last_cursor
+            prev_cursor = first_cursor if has_more else None
+        else:
+            next_cursor = last_cursor if has_more else None
+            prev_cursor = first_cursor if self.cursor is not None else None
+
+        return docs, next_cursor, prev_cursor
+
+
+def keyset_page(collection, query, field, direction=1, after=None, before=None,
+                per_page=20, projection=None):
+    """
+    Paginación por cursor (keyset) sobre (field, _id).
+
+    A diferencia de skip/limit, el costo de cada página no depende de su
+    posición: la consulta arranca en el último valor visto usando el índice.
+
+    Devuelve (documentos, cursor_siguiente, cursor_anterior).
+    """
+    plan = _KeysetPlan(field, direction, after, before)
+    docs = list(
+        collection.find(plan.apply(query), projection)
+        .sort(plan.sort)
+        .limit(per_page + 1)
+    )
+    return plan.finish(docs, per_page)
+
+
+def keyset_facet(collection, query, field, direction=1, after=None, before=None,
+                 per_page=20, facets=None, projection=None):
+    """
+    keyset_page más los sub-pipelines de `facets` (conteos, histogramas)
+    sobre el mismo filtro, sin la condición del cursor.
+
+    Son dos viajes: la página sale de un find sobre el índice (field, _id),
+    igual que keyset_page, y solo los conteos van en un $facet. Dentro de un
+    $facet todo se ordena en memoria sobre el conjunto filtrado completo, así
+    que la página no puede ir ahí sin perder el índice.
+
+    Devuelve (documentos, cursor_siguiente, cursor_anterior, resultados_facets).
+    """
+    docs, next_cursor, prev_cursor = keyset_page(
+        collection, query, field, direction, after=after, before=before,
+        per_page=per_page, projection=projection
+    )
+    result = {}
+    if facets:
+        result = next(collection.aggregate([{'$match': query}, {'$facet': facets}]), {})
+    return docs, next_cursor, prev_cursor, result
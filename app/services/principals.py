@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+from app.services.loaders import get_user
+
+# Identidad de la sesión (rol, nombre, password_changed) en memoria del proceso.
+# Evita leer `users` en cada petición autenticada; cada proceso la relee como
+# mucho cada PRINCIPAL_CACHE_TTL segundos, y las vistas que modifican un
+# usuario la invalidan de inmediato en el proceso que atendió el cambio.
+PRINCIPAL_CACHE_TTL = 60
+PRINCIPAL_CACHE_SIZE = 1024
+
+
+class TTLCache:
+    """LRU acotado con caducidad por entrada; seguro entre hilos."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_principals = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('PRINCIPAL_CACHE_TTL', PRINCIPAL_CACHE_TTL)
+    return PRINCIPAL_CACHE_TTL
+
+
+def get_principal(user_id):
+    """
+    {'role', 'name', 'password_changed'} del usuario, desde la cache del
+    proceso o, si no está o caducó, desde MongoDB. None si no existe.
+    """
+    key = str(user_id)
+    principal = _principals.get(key)
+    if principal is None:
+        user = get_user(user_id)
+        if not user:
+            return None
+        principal = {
+            'role': user.get('role', 'cliente'),
+            'name': user.get('name', 'Usuario'),
+            'password_changed': user.get('password_changed', False),
+        }
+        _principals.set(key, principal, ttl=_ttl())
+    return principal
+
+
+def invalidate_principal(user_id=None):
+    """Descarta la identidad cacheada de un usuario (o de todos si user_id es None)."""
+    if user_id is None:
+        _principals.clear()
+    else:
+        _principals.pop(str(user_id))
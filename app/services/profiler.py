@@ -0,0 +1,245 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import g, request
+from pymongo import monitoring
+
+# Perfil de consultas MongoDB por petición
+#
+# Un CommandListener de pymongo (registrado al crear el MongoClient en
+# app/_init_.py) anota cada comando del hilo que atiende la petición:
+# colección, forma de la consulta (campos y operadores, sin valores) y
+# duración. Al terminar la petición se publica:
+#
+# - Cabecera Server-Timing: total y tiempo por colección. Revela nombres de
+#   colecciones y cantidad de consultas, así que solo se envía en debug, en
+#   pruebas o con QUERY_SERVER_TIMING activado.
+# - Una línea JSON en el logger 'mongo.profile'.
+# - Aviso de N+1 si una misma forma se repite más de QUERY_REPEAT_THRESHOLD veces.
+#
+# En pruebas (app.testing), QUERY_BUDGETS = {'endpoint': máximo} y el
+# context manager query_budget() fallan si una ruta se pasa de consultas.
+#
+# Límite: el resumen se publica en after_request, antes de enviar el cuerpo.
+# En respuestas en streaming (exportar_ordenes) las consultas que se hacen
+# mientras se genera el cuerpo no aparecen en la cabecera, el log ni
+# QUERY_BUDGETS. Para acotarlas en una prueba, leer el cuerpo dentro de un
+# query_budget():
+#
+#     with query_budget(max_queries=4):
+#         client.get('/ordenes/exportar?format=csv').get_data()
+
+profile_logger = logging.getLogger('mongo.profile')
+
+QUERY_REPEAT_THRESHOLD = 5
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _paths(value, prefix=''):
+    """Campos y operadores de un filtro, sin valores: {'a': {'$in': [..]}} -> ['a.$in']."""
+    if isinstance(value, dict):
+        paths = []
+        for key in value:
+            path = f'{prefix}.{key}' if prefix else key
+            child = value[key]
+            if isinstance(child, dict) or (key in ('$and', '$or', '$nor') and isinstance(child, list)):
+                paths.extend(_paths(child, path) or [path])
+            else:
+                paths.append(path)
+        return paths
+    if isinstance(value, list):
+        return [p for item in value for p in _paths(item, prefix)]
+    return []
+
+
+def command_shape(name, command):
+    """(colección, forma) de un comando, o (None, None) si no actúa sobre una colección."""
+    collection = command.get('collection') if name == 'getMore' else command.get(name)
+    if not isinstance(collection, str):
+        return None, None
+    if name == 'find':
+        spec = _paths(command.get('filter'))
+    elif name == 'aggregate':
+        spec = []
+        for stage in command.get('pipeline', []):
+            op = next(iter(stage), '')
+            spec.append(f"{op}({','.join(sorted(_paths(stage[op])))})" if op == '$match' else op)
+        return collection, f"{name} {' | '.join(spec)}"
+    elif name in ('update', 'delete'):
+        statements = command.get('updates' if name == 'update' else 'deletes') or [{}]
+        spec = _paths(statements[0].get('q'))
+    elif name in ('count', 'distinct', 'findAndModify'):
+        spec = _paths(command.get('query'))
+    else:
+        spec = []
+    return collection, f"{name} {','.join(sorted(set(spec)))}".strip()
+
+
+class RequestProfile:
+    """Comandos de una petición agrupados por (colección, forma)."""
+
+    def __init__(self):
+        self.shapes = OrderedDict()
+
+    def record(self, collection, shape, duration_ms):
+        entry = self.shapes.setdefault((collection, shape), {'count': 0, 'ms': 0.0})
+        entry['count'] += 1
+        entry['ms'] += duration_ms
+
+    @property
+    def count(self):
+        return sum(e['count'] for e in self.shapes.values())
+
+    @property
+    def duration_ms(self):
+        return sum(e['ms'] for e in self.shapes.values())
+
+    def by_collection(self):
+        totals = OrderedDict()
+        for (collection, _), entry in self.shapes.items():
+            total = totals.setdefault(collection, {'count': 0, 'ms': 0.0})
+            total['count'] += entry['count']
+            total['ms'] += entry['ms']
+        return totals
+
+    def repeated(self, threshold):
+        """Formas que se repiten más de `threshold` veces (probable N+1)."""
+        return [
+            {'collection': c, 'shape': s, 'count': e['count']}
+            for (c, s), e in self.shapes.items() if e['count'] > threshold
+        ]
+
+    def server_timing(self):
+        parts = [f'mongo;dur={self.duration_ms:.1f};desc="{self.count} consultas"']
+        for collection, total in self.by_collection().items():
+            parts.append(f'mongo-{collection};dur={total["ms"]:.1f};desc="{total["count"]}"')
+        return ', '.join(parts)
+
+
+def _recorders():
+    """Perfiles activos en este hilo (el de la petición y los query_budget abiertos)."""
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+        _local.pending = {}
+    return _local.recorders
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Anota los comandos del hilo actual en sus perfiles activos."""
+
+    def started(self, event):
+        if not _recorders():
+            return
+        collection, shape = command_shape(event.command_name, event.command)
+        if collection is not None:
+            _local.pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _finish(self, event):
+        recorders = _recorders()
+        key = _local.pending.pop((event.connection_id, event.request_id), None)
+        if key is None:
+            return
+        for profile in recorders:
+            profile.record(key[0], key[1], event.duration_micros / 1000.0)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+
+command_profiler = CommandProfiler()
+
+
+class query_budget:
+    """
+    Para pruebas: falla si dentro del bloque se superan `max_queries`
+    comandos o alguna forma se repite más de `max_repeats` veces.
+
+        with query_budget(max_queries=6, max_repeats=1):
+            client.get('/ordenes/list')
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.profile = RequestProfile()
+
+    def __enter__(self):
+        _recorders().append(self.profile)
+        return self.profile
+
+    def __exit__(self, exc_type, exc, tb):
+        _recorders().remove(self.profile)
+        if exc_type is not None:
+            return False
+        if self.max_queries is not None and self.profile.count > self.max_queries:
+            raise QueryBudgetExceeded(
+                f'{self.profile.count} consultas (máximo {self.max_queries}): {_describe(self.profile)}'
+            )
+        if self.max_repeats is not None:
+            repeated = self.profile.repeated(self.max_repeats)
+            if repeated:
+                raise QueryBudgetExceeded(f'Consultas repetidas (N+1): {repeated}')
+        return False
+
+
+def _describe(profile):
+    return '; '.join(f"{c} {s} x{e['count']}" for (c, s), e in profile.shapes.items())
+
+
+def init_query_profiler(app):
+    """Activa el perfil por petición (el listener se pasa al MongoClient)."""
+
+    @app.before_request
+    def _start_profile():
+        g.query_profile = RequestProfile()
+        _recorders().append(g.query_profile)
+
+    @app.after_request
+    def _publish_profile(response):
+        profile = g.get('query_profile')
+        if profile is None:
+            return response
+        threshold = app.config.get('QUERY_REPEAT_THRESHOLD', QUERY_REPEAT_THRESHOLD)
+        repeated = profile.repeated(threshold)
+
+        if app.debug or app.testing or app.config.get('QUERY_SERVER_TIMING'):
+            response.headers.add('Server-Timing', profile.server_timing())
+        line = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': profile.count,
+            'mongo_ms': round(profile.duration_ms, 2),
+            'by_collection': {c: t['count'] for c, t in profile.by_collection().items()},
+        }
+        if repeated:
+            line['n_plus_one'] = repeated
+            profile_logger.warning(json.dumps(line, ensure_ascii=False))
+        else:
+            profile_logger.info(json.dumps(line, ensure_ascii=False))
+
+        # Presupuesto de consultas por ruta (solo en pruebas)
+        budget = app.config.get('QUERY_BUDGETS', {}).get(request.endpoint)
+        if app.testing and budget is not None and profile.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.endpoint}: {profile.count} consultas (máximo {budget}): {_describe(profile)}'
+            )
+
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exc=None):
+        profile = g.pop('query_profile', None)
+        if profile is not None and profile in _recorders():
+            _recorders().remove(profile)
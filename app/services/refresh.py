@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+
+from flask import current_app
+
+from app import extensions
+from app.services.generations import generation
+
+# Valores servidos vencidos mientras se recalculan (stale-while-revalidate)
+#
+# Cada entrada se guarda en la cache compartida bajo una clave estable junto
+# con el momento en que se calculó y las generaciones de sus dominios:
+#   {'value': ..., 'built_at': epoch, 'generations': {'orders': 12, ...}}
+#
+# - Fresca (misma generación y dentro de `fresh_for`): se sirve tal cual.
+# - Vencida (cambió una generación o pasó `fresh_for`): se sirve igualmente y
+#   un único hilo en segundo plano la recalcula.
+# - Ausente (o más vieja que `max_stale`, que es su timeout en la cache): se
+#   calcula en la petición; las demás peticiones esperan ese cálculo.
+#
+# Un solo recálculo por clave a la vez: un candado en la cache compartida
+# (cache.add, que no sobrescribe) entre workers y un registro de hilos dentro
+# del proceso. Entre workers el candado solo es fiable si `add` es atómico:
+# RedisCache (SET NX) o SimpleCache con un solo proceso. Con FileSystemCache
+# `add` comprueba y luego escribe, y dos workers pueden recalcular a la vez.
+REFRESH_FRESH_FOR = 300
+REFRESH_MAX_STALE = 3600
+REFRESH_LOCK_TIMEOUT = 60
+REFRESH_COLD_WAIT = 5
+
+_refreshes = {}
+_refreshes_lock = threading.Lock()
+
+
+def _entry_key(name):
+    return f'swr:{name}'
+
+
+def _lock_key(name):
+    return f'swr-lock:{name}'
+
+
+def _acquire(name):
+    """Token del candado compartido de `name`, o None si otro lo tiene."""
+    token = uuid.uuid4().hex
+    if extensions.cache.add(_lock_key(name), token, timeout=REFRESH_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def _release(name, token):
+    if extensions.cache.get(_lock_key(name)) == token:
+        extensions.cache.delete(_lock_key(name))
+
+
+def _build_and_store(name, domains, build, max_stale):
+    # Las generaciones se leen antes de calcular: si cambian durante el
+    # cálculo, la entrada nace vencida y se vuelve a recalcular
+    generations = {d: generation(d) for d in domains}
+    value = build()
+    extensions.cache.set(_entry_key(name), {
+        'value': value,
+        'built_at': time.time(),
+        'generations': generations,
+    }, timeout=max_stale)
+    return value
+
+
+def _refresh(app, name, domains, build, max_stale):
+    try:
+        with app.app_context():
+            token = _acquire(name)
+            if token is None:
+                return
+            try:
+                _build_and_store(name, domains, build, max_stale)
+            except Exception:
+                app.logger.exception('Error recalculando %s', name)
+            finally:
+                _release(name, token)
+    finally:
+        with _refreshes_lock:
+            _refreshes.pop(name, None)
+
+
+def _schedule_refresh(name, domains, build, max_stale):
+    """Lanza el recálculo de `name` en segundo plano si no hay uno en curso."""
+    with _refreshes_lock:
+        if name in _refreshes:
+            return _refreshes[name]
+        app = current_app._get_current_object()
+        thread = threading.Thread(
+            target=_refresh, args=(app, name, domains, build, max_stale),
+            name=f'swr-{name}', daemon=True
+        )
+        _refreshes[name] = thread
+    thread.start()
+    return thread
+
+
+def is_fresh(entry, domains, fresh_for):
+    if time.time() - entry['built_at'] > fresh_for:
+        return False
+    return all(entry['generations'].get(d) == generation(d) for d in domains)
+
+
+def stale_while_revalidate(name, domains, build, fresh_for=REFRESH_FRESH_FOR,
+                           max_stale=REFRESH_MAX_STALE):
+    """
+    Valor de `name` desde la cache compartida, sirviendo la última versión
+    aunque esté vencida y recalculándola en segundo plano.
+
+    `build` no recibe argumentos y no debe depender de la petición (corre en
+    otro hilo, con su propio contexto de aplicación); `domains` son los
+    dominios de generations.CACHE_DOMAINS de los que depende el valor.
+    """
+    entry = extensions.cache.get(_entry_key(name))
+    if entry is not None:
+        if not is_fresh(entry, domains, fresh_for):
+            _schedule_refresh(name, domains, build, max_stale)
+        return entry['value']
+
+    # Sin valor que servir: uno calcula y el resto espera su resultado
+    token = _acquire(name)
+    if token is None:
+        deadline = time.monotonic() + REFRESH_COLD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = extensions.cache.get(_entry_key(name))
+            if entry is not None:
+                return entry['value']
+        # El otro cálculo no terminó a tiempo: calcular sin candado
+        return _build_and_store(name, domains, build, max_stale)
+    try:
+        return _build_and_store(name, domains, build, max_stale)
+    finally:
+        _release(name, token)
@@ -0,0 +1,198 @@
+from pymongo import UpdateOne
+from app import extensions
+
+# Resumen diario de indicadores (`daily_stats`)
+#
+# Un documento por día y dimensión con los conteos por estado:
+#   {_id: '2025-03-10:vendor:<id>', day: '2025-03-10', dimension: 'vendor',
+#    key: ObjectId(...), status: {pending: 2, in_progress: 1, completed: 4}}
+#
+# Dimensiones:
+#   - 'orders'     órdenes activas, por día de creación
+#   - 'vendor'     órdenes activas de cada vendedor (key = assigned_vendor_id)
+#   - 'technician' tareas de cada técnico en órdenes activas, por día de
+#                  creación de la tarea (key = technician_id)
+#
+# Además del día, cada cambio se suma al documento acumulado day='total'.
+# Los documentos se mantienen con $inc al escribir órdenes y tareas y se
+# regeneran desde el historial con rebuild_stats (`flask db rebuild-daily-stats`).
+
+DAILY_STATS = 'daily_stats'
+TOTAL_DAY = 'total'
+STATUSES = ('pending', 'in_progress', 'completed')
+REBUILD_BATCH_SIZE = 500
+
+
+def day_key(dt):
+    """Día 'YYYY-MM-DD' de una fecha; None si no hay fecha."""
+    return dt.strftime('%Y-%m-%d') if dt else None
+
+
+def stat_id(day, dimension, key=None):
+    return f"{day}:{dimension}:{key if key is not None else ''}"
+
+
+def order_changes(order, old_status, new_status):
+    """
+    Cambios de resumen para una orden: dimensión 'orders' y, si tiene
+    vendedor asignado, 'vendor'. Use None como estado anterior para una orden
+    nueva y como nuevo para una orden que deja de estar activa.
+    """
+    created_at = order.get('created_at')
+    changes = [('orders', None, created_at, old_status, new_status)]
+    if order.get('assigned_vendor_id'):
+        changes.append(('vendor', order['assigned_vendor_id'], created_at, old_status, new_status))
+    return changes
+
+
+def task_changes(task, old_status, new_status):
+    """Cambios de resumen para una tarea (dimensión 'technician')."""
+    if not task.get('technician_id'):
+        return []
+    return [('technician', task['technician_id'], task.get('created_at'), old_status, new_status)]
+
+
+def vendor_changes(order, new_vendor_id):
+    """Cambios de resumen al reasignar el vendedor de una orden activa."""
+    if not order.get('is_active') or order.get('assigned_vendor_id') == new_vendor_id:
+        return []
+    status = order.get('status') if order.get('status') in STATUSES else 'pending'
+    changes = []
+    if order.get('assigned_vendor_id'):
+        changes.append(('vendor', order['assigned_vendor_id'], order.get('created_at'), status, None))
+    if new_vendor_id:
+        changes.append(('vendor', new_vendor_id, order.get('created_at'), None, status))
+    return changes
+
+
+def record_changes(changes, session=None):
+    """
+    Aplica cambios (dimension, key, created_at, estado_anterior, estado_nuevo)
+    a `daily_stats` con un único bulk_write de $inc (upsert), en el documento
+    del día y en el acumulado. Las fechas ausentes solo cuentan en el acumulado.
+    """
+    incs = {}
+    for dimension, key, created_at, old, new in changes:
+        if old == new:
+            continue
+        days = [TOTAL_DAY]
+        if created_at:
+            days.append(day_key(created_at))
+        for day in days:
+            inc = incs.setdefault((day, dimension, key), {})
+            if old is not None:
+                inc[f'status.{old}'] = inc.get(f'status.{old}', 0) - 1
+            if new is not None:
+                inc[f'status.{new}'] = inc.get(f'status.{new}', 0) + 1
+
+    ops = []
+    for (day, dimension, key), inc in incs.items():
+        inc = {f: n for f, n in inc.items() if n}
+        if inc:
+            ops.append(UpdateOne(
+                {'_id': stat_id(day, dimension, key)},
+                {'$inc': inc, '$setOnInsert': {'day': day, 'dimension': dimension, 'key': key}},
+                upsert=True
+            ))
+    if ops:
+        extensions.db[DAILY_STATS].bulk_write(ops, ordered=False, session=session)
+
+
+# Lectura -------------------------------------------------------------------
+
+def _counts(doc):
+    status = (doc or {}).get('status') or {}
+    return {s: status.get(s, 0) for s in STATUSES}
+
+
+def get_stats(dimension, key=None, day=None):
+    """
+    Conteos por estado de una dimensión en un día (fecha o 'YYYY-MM-DD');
+    sin día, los acumulados. Siempre incluye las tres claves de estado.
+    """
+    if day is not None and not isinstance(day, str):
+        day = day_key(day)
+    doc = extensions.db[DAILY_STATS].find_one({'_id': stat_id(day or TOTAL_DAY, dimension, key)})
+    return _counts(doc)
+
+
+def get_stats_many(dimension, keys, day=None):
+    """Como get_stats para varias claves a la vez (una sola consulta por _id)."""
+    if day is not None and not isinstance(day, str):
+        day = day_key(day)
+    day = day or TOTAL_DAY
+    ids = {stat_id(day, dimension, k): k for k in keys}
+    found = {
+        ids[doc['_id']]: _counts(doc)
+        for doc in extensions.db[DAILY_STATS].find({'_id': {'$in': list(ids)}})
+    }
+    return {k: found.get(k, _counts(None)) for k in keys}
+
+
+# Regeneración --------------------------------------------------------------
+
+# Tareas cuya orden sigue activa (las de órdenes eliminadas no cuentan)
+_ACTIVE_ORDER_STAGES = [
+    {'$lookup': {'from': 'service_orders', 'localField': 'order_id', 'foreignField': '_id', 'as': 'order'}},
+    {'$match': {'order.is_active': True}},
+]
+
+
+def _count_by_day(collection, match, key_field=None, stages=()):
+    """
+    Agrupa por día de `created_at`, estado y (opcional) `key_field`, después
+    del $match y de `stages`. Los documentos sin fecha se agrupan aparte y
+    se devuelven con día None.
+    """
+    group_id = {'status': '$status'}
+    if key_field:
+        group_id['key'] = f'${key_field}'
+    dated = dict(group_id, day={'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}})
+    for date_match, _id in (({'$type': 'date'}, dated), ({'$not': {'$type': 'date'}}, group_id)):
+        pipeline = [
+            {'$match': dict(match, created_at=date_match)},
+            *stages,
+            {'$group': {'_id': _id, 'count': {'$sum': 1}}},
+        ]
+        for row in collection.aggregate(pipeline, allowDiskUse=True):
+            yield row['_id'].get('day'), row['_id'].get('key'), row['_id'].get('status'), row['count']
+
+
+def rebuild_stats():
+    """
+    Regenera `daily_stats` desde el historial de órdenes y tareas y devuelve
+    el número de documentos. Se construye en una colección temporal que luego
+    reemplaza a la actual; los cambios que lleguen mientras corre no quedan
+    reflejados.
+    """
+    docs = {}
+
+    def add(day, dimension, key, status, count):
+        for d in ((TOTAL_DAY, day) if day else (TOTAL_DAY,)):
+            _id = stat_id(d, dimension, key)
+            doc = docs.setdefault(_id, {
+                '_id': _id, 'day': d, 'dimension': dimension, 'key': key,
+                'status': {s: 0 for s in STATUSES}
+            })
+            # Estados desconocidos cuentan como pendientes
+            doc['status'][status if status in STATUSES else 'pending'] += count
+
+    db = extensions.db
+    for day, vendor, status, count in _count_by_day(db.service_orders, {'is_active': True}, 'assigned_vendor_id'):
+        add(day, 'orders', None, status, count)
+        if vendor:
+            add(day, 'vendor', vendor, status, count)
+    for day, tech, status, count in _count_by_day(db.service_tasks, {'technician_id': {'$ne': None}},
+                                                  'technician_id', _ACTIVE_ORDER_STAGES):
+        add(day, 'technician', tech, status, count)
+
+    staging = db[DAILY_STATS + '_rebuild']
+    staging.drop()
+    batch = list(docs.values())
+    for i in range(0, len(batch), REBUILD_BATCH_SIZE):
+        staging.insert_many(batch[i:i + REBUILD_BATCH_SIZE], ordered=False)
+    if batch:
+        staging.rename(DAILY_STATS, dropTarget=True)
+    else:
+        db[DAILY_STATS].delete_many({})
+    return len(batch)
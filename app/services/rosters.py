@@ -0,0 +1,57 @@
+import time
+
+from app import extensions
+from app.services.generations import bump_generation
+
+# Listas de personal (técnicos, vendedores, clientes...) para selects, filtros y tablas
+ROSTER_ROLES = ('administrador', 'supervisor', 'tecnico', 'vendedor', 'cliente')
+ROSTER_TIMEOUT = 300
+ROSTER_FIELDS = ('name', 'especialidad')
+ROSTER_DETAIL_FIELDS = ROSTER_FIELDS + ('cedula', 'phone', 'email', 'address')
+
+
+def _version_key(role):
+    return f'roster_version:{role}'
+
+
+def roster_version(role):
+    """Sello de versión de la lista de un rol; cambia en cada invalidación."""
+    version = extensions.cache.get(_version_key(role))
+    if version is None:
+        # Semilla por reloj (ver generations.generation): no revive claves viejas
+        extensions.cache.add(_version_key(role), int(time.time() * 1000), timeout=0)
+        version = extensions.cache.get(_version_key(role))
+    return version
+
+
+def get_roster(role, detail=False):
+    """
+    Usuarios activos de un rol ordenados por nombre, servidos desde la cache.
+
+    Por defecto cada entrada es compacta ({_id, name, especialidad}); con
+    detail=True incluye además datos de contacto para las tablas de gestión.
+    Nunca incluye el hash de la contraseña. La clave de cache lleva el sello
+    de versión del rol, así que una invalidación deja obsoletas todas las variantes.
+    """
+    fields = ROSTER_DETAIL_FIELDS if detail else ROSTER_FIELDS
+    key = f"roster:{role}:{'detail' if detail else 'compact'}:v{roster_version(role)}"
+    roster = extensions.cache.get(key)
+    if roster is None:
+        cursor = extensions.db.users.find(
+            {'role': role, 'is_active': True},
+            {f: 1 for f in fields}
+        ).sort('name', 1)
+        roster = [dict({f: u.get(f, '') for f in fields}, _id=u['_id']) for u in cursor]
+        extensions.cache.set(key, roster, timeout=ROSTER_TIMEOUT)
+    return roster
+
+
+def invalidate_roster(role=None):
+    """Incrementa el sello de versión del rol (o de todos si role es None)."""
+    roles = [role] if role in ROSTER_ROLES else ROSTER_ROLES
+    for r in roles:
+        # Incremento atómico, como bump_generation
+        roster_version(r)
+        extensions.cache.cache.inc(_version_key(r))
+    # Cambió algún usuario: también lo cacheado que depende del dominio 'users'
+    bump_generation('users')
@@ -0,0 +1,116 @@
+from bson import ObjectId
+
+# Campos de referencia (ids de otros documentos) que deben guardarse como ObjectId.
+# Cada entrada es (campo, tipo) con tipo 'id', 'ids' (lista de ids) o
+# 'relations' (lista de subdocumentos con `client_id`).
+REFERENCE_FIELDS = {
+    'service_orders': [
+        ('client_id', 'id'),
+        ('vehicle_id', 'id'),
+        ('created_by', 'id'),
+        ('assigned_vendor_id', 'id'),
+        ('technician_ids', 'ids'),
+    ],
+    'service_tasks': [
+        ('order_id', 'id'),
+        ('technician_id', 'id'),
+    ],
+    'vehicles': [
+        ('relations', 'relations'),
+    ],
+}
+
+_OBJECT_ID_OR_NULL = {'bsonType': ['objectId', 'null']}
+
+
+def _schema_for(fields):
+    properties = {}
+    for field, kind in fields:
+        if kind == 'id':
+            properties[field] = _OBJECT_ID_OR_NULL
+        elif kind == 'ids':
+            properties[field] = {'bsonType': 'array', 'items': {'bsonType': 'objectId'}}
+        elif kind == 'relations':
+            properties[field] = {
+                'bsonType': 'array',
+                'items': {
+                    'bsonType': 'object',
+                    'properties': {'client_id': _OBJECT_ID_OR_NULL},
+                },
+            }
+    return {'$jsonSchema': {'bsonType': 'object', 'properties': properties}}
+
+
+# Validadores $jsonSchema: solo restringen el tipo de las referencias
+VALIDATORS = {name: _schema_for(fields) for name, fields in REFERENCE_FIELDS.items()}
+
+
+def _convert_id(value):
+    """(valor, cambió, inválido) para una referencia individual."""
+    if isinstance(value, str):
+        if ObjectId.is_valid(value):
+            return ObjectId(value), True, False
+        return value, False, True
+    return value, False, False
+
+
+def normalize_references(collection, doc):
+    """
+    Convierte a ObjectId las referencias guardadas como texto en `doc`.
+
+    Devuelve ($set con los campos a reescribir, {campo: convertidos},
+    {campo: valores inválidos}). Los textos que no son un ObjectId válido se
+    dejan tal cual y se informan como inválidos.
+    """
+    updates, converted, invalid = {}, {}, {}
+
+    def count(target, field, n=1):
+        target[field] = target.get(field, 0) + n
+
+    for field, kind in REFERENCE_FIELDS[collection]:
+        value = doc.get(field)
+        if value is None:
+            continue
+        if kind == 'id':
+            new, changed, bad = _convert_id(value)
+            if changed:
+                updates[field] = new
+                count(converted, field)
+            if bad:
+                count(invalid, field)
+        elif kind == 'ids' and isinstance(value, list):
+            items, changed_any = [], False
+            for item in value:
+                new, changed, bad = _convert_id(item)
+                items.append(new)
+                if changed:
+                    changed_any = True
+                    count(converted, field)
+                if bad:
+                    count(invalid, field)
+            if changed_any:
+                updates[field] = items
+        elif kind == 'relations' and isinstance(value, list):
+            relations, changed_any = [], False
+            for relation in value:
+                relation = dict(relation)
+                new, changed, bad = _convert_id(relation.get('client_id'))
+                if changed:
+                    relation['client_id'] = new
+                    changed_any = True
+                    count(converted, f'{field}.client_id')
+                if bad:
+                    count(invalid, f'{field}.client_id')
+                relations.append(relation)
+            if changed_any:
+                updates[field] = relations
+    return updates, converted, invalid
+
+
+def string_reference_filter(collection):
+    """Filtro de documentos con alguna referencia guardada como texto."""
+    clauses = []
+    for field, kind in REFERENCE_FIELDS[collection]:
+        path = f'{field}.client_id' if kind == 'relations' else field
+        clauses.append({path: {'$type': 'string'}})
+    return {'$or': clauses}
@@ -0,0 +1,120 @@
+import heapq
+import re
+import unicodedata
+from app import extensions
+
+def normalize_plate(plate):
+    """
+    Clave normalizada de una placa: mayúsculas y solo letras (incluidas las
+    no ASCII, como Ñ) y dígitos. 'abc-123', 'ABC 123' y 'Abc123' producen la
+    misma clave 'ABC123'; 'AÑ-123' y 'AN-123' no.
+    """
+    if not plate:
+        return ''
+    return ''.join(ch for ch in unicodedata.normalize('NFC', plate.upper()) if ch.isalnum())
+
+
+def plate_prefix_query(plate_query):
+    """
+    Filtro por prefijo sobre `plate_key`. La expresión está anclada (^) y es
+    sensible a mayúsculas, por lo que MongoDB la resuelve como un rango del
+    índice; el `$gt: ''` cumple el filtro del índice parcial (ver indexes.py).
+    """
+    key = normalize_plate(plate_query)
+    if not key:
+        return None
+    return {'plate_key': {'$gt': '', '$regex': '^' + re.escape(key)}}
+
+
+# Búsqueda de personas por nombre -------------------------------------------
+
+_TOKEN_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+def fold_text(text):
+    """Minúsculas y sin acentos: 'María Ñáñez' -> 'maria nanez'."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def name_tokens(name):
+    """Tokens normalizados del nombre, guardados en `users.name_tokens`."""
+    return sorted({tok for tok in _TOKEN_SPLIT.split(fold_text(name)) if tok})
+
+
+def search_people(role, text, limit=20, projection=None):
+    """
+    Busca usuarios activos de un rol por prefijo de palabras del nombre.
+
+    Cada palabra de la búsqueda debe ser prefijo de alguna palabra del nombre
+    ('mar gon' encuentra 'María González'). Las expresiones están ancladas sobre
+    `name_tokens`, así que la consulta usa el índice parcial (role, name_tokens)
+    de usuarios activos. Se puntúan todas las coincidencias y se devuelven las
+    `limit` más relevantes.
+    """
+    # Se conserva el orden en que se escribieron las palabras
+    terms = list(dict.fromkeys(tok for tok in _TOKEN_SPLIT.split(fold_text(text)) if tok))
+    if not terms:
+        return []
+
+    query = {
+        'role': role,
+        'is_active': True,
+        '$and': [{'name_tokens': {'$regex': '^' + re.escape(t)}} for t in terms],
+    }
+    fields = {'name': 1, 'name_tokens': 1}
+    if projection:
+        fields.update(projection)
+
+    def score(user):
+        tokens = user.get('name_tokens') or []
+        exact = sum(1 for t in terms if t in tokens)
+        leading = 1 if fold_text(user.get('name')).startswith(terms[0]) else 0
+        return (-exact, -leading, fold_text(user.get('name')))
+
+    # Se recorren todas las coincidencias (solo los campos pedidos) y se
+    # conservan las `limit` mejores: el corte no depende del orden alfabético
+    return heapq.nsmallest(limit, extensions.db.users.find(query, fields), key=score)
+
+
+# Autocompletado de clientes -------------------------------------------------
+
+_CEDULA_SEPARATORS = re.compile(r'[\s.\-]')
+
+
+def search_clients(text, limit=10):
+    """
+    Sugerencias de clientes activos para los formularios (autocompletado).
+
+    Si el texto contiene dígitos se buscan primero cédulas que empiecen por él
+    (expresión anclada sobre el índice único de `cedula`); el resto de los
+    resultados sale de search_people por prefijo de nombre. Devuelve a lo sumo
+    `limit` documentos {_id, name, cedula}, sin duplicados.
+    """
+    text = (text or '').strip()
+    if not text:
+        return []
+
+    results = []
+    cedula = _CEDULA_SEPARATORS.sub('', text)
+    if any(ch.isdigit() for ch in cedula):
+        results = list(
+            extensions.db.users.find(
+                {'cedula': {'$regex': '^' + re.escape(cedula)}, 'role': 'cliente', 'is_active': True},
+                {'name': 1, 'cedula': 1}
+            ).sort('cedula', 1).limit(limit)
+        )
+
+    seen = {c['_id'] for c in results}
+    if len(results) < limit:
+        for client in search_people('cliente', text, limit=limit, projection={'cedula': 1}):
+            if client['_id'] not in seen:
+                seen.add(client['_id'])
+                results.append(client)
+
+    return [
+        {'_id': c['_id'], 'name': c.get('name', ''), 'cedula': c.get('cedula', '')}
+        for c in results[:limit]
+    ]
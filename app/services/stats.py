@@ -0,0 +1,240 @@
+import calendar
+from datetime import datetime
+from bson import ObjectId
+from app import extensions
+from app.services.orders import TASK_STATUSES
+from app.services.rollups import get_stats, get_stats_many
+
+# Horizontes permitidos para la serie mensual del dashboard
+MONTH_HORIZONS = (6, 12, 24)
+
+
+def month_starts(months, now=None):
+    """
+    Primer día de cada uno de los últimos `months` meses calendario (el actual
+    incluido), del más antiguo al más reciente, y el inicio del mes siguiente
+    como límite superior exclusivo.
+    """
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1
+    starts = [datetime(i // 12, i % 12 + 1, 1) for i in range(index - months + 1, index + 1)]
+    upper = datetime((index + 1) // 12, (index + 1) % 12 + 1, 1)
+    return starts, upper
+
+
+def monthly_order_series(months=6, now=None):
+    """
+    Órdenes activas por mes calendario con una sola agregación.
+
+    Filtra por rango sobre `created_at` (índice) con límites [1º del primer
+    mes, 1º del mes siguiente al actual) y agrupa por año/mes. Los meses sin
+    órdenes aparecen con 0. Cada elemento: {'month', 'year', 'orders'}.
+    """
+    starts, upper = month_starts(months, now)
+    counts = {
+        (row['_id']['year'], row['_id']['month']): row['count']
+        for row in extensions.db.service_orders.aggregate([
+            {'$match': {'created_at': {'$gte': starts[0], '$lt': upper}, 'is_active': True}},
+            {'$group': {
+                '_id': {'year': {'$year': '$created_at'}, 'month': {'$month': '$created_at'}},
+                'count': {'$sum': 1}
+            }},
+        ])
+    }
+    # Con más de un año de historia se agrega el año a la etiqueta ('Jan 25')
+    with_year = months > 12
+    series = []
+    for start in starts:
+        label = calendar.month_name[start.month][:3]
+        if with_year:
+            label = f'{label} {start.year % 100:02d}'
+        series.append({
+            'month': label,
+            'year': start.year,
+            'orders': counts.get((start.year, start.month), 0)
+        })
+    return series
+
+
+def technician_productivity(start=None, end=None, limit=None):
+    """
+    Tareas totales y completadas por técnico, agrupando `service_tasks` por
+    `technician_id` (opcionalmente solo las creadas en [start, end)).
+
+    Los nombres se buscan al final, sobre las filas ya agrupadas; se omiten
+    técnicos inactivos y 'Sin asignar'. Ordenado de más a menos tareas.
+    """
+    match = {'technician_id': {'$ne': None}}
+    if start or end:
+        match['created_at'] = {}
+        if start:
+            match['created_at']['$gte'] = start
+        if end:
+            match['created_at']['$lt'] = end
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': '$technician_id',
+            'total_tasks': {'$sum': 1},
+            'completed_tasks': {'$sum': {'$cond': [{'$eq': ['$status', 'completed']}, 1, 0]}}
+        }},
+        {'$lookup': {
+            'from': 'users',
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'user'
+        }},
+        {'$unwind': '$user'},
+        {'$match': {'user.role': 'tecnico', 'user.is_active': True, 'user.name': {'$ne': 'Sin asignar'}}},
+        {'$project': {'name': '$user.name', 'total_tasks': 1, 'completed_tasks': 1}},
+        {'$sort': {'total_tasks': -1, 'name': 1}},
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+    return list(extensions.db.service_tasks.aggregate(pipeline, allowDiskUse=True))
+
+
+def _status_sum(status):
+    return {'$sum': {'$cond': [{'$eq': ['$status', status]}, 1, 0]}}
+
+
+def technician_workload(technician_ids, start, end):
+    """
+    Carga de trabajo de cada técnico en el día [start, end): conteos por
+    estado del resumen diario (dimensión 'technician') y, con un único
+    $group sobre las tareas del día, la descripción de la más reciente.
+    Devuelve {technician_id: {'counts', 'last_task'}} para todos los ids.
+    """
+    technician_ids = list(technician_ids)
+    counts = get_stats_many('technician', technician_ids, day=start)
+    pipeline = [
+        {'$match': {'technician_id': {'$in': technician_ids}, 'created_at': {'$gte': start, '$lt': end}}},
+        {'$sort': {'created_at': -1}},
+        {'$group': {'_id': '$technician_id', 'last_task': {'$first': '$description'}}},
+    ]
+    last_tasks = {row['_id']: row.get('last_task') for row in extensions.db.service_tasks.aggregate(pipeline)}
+    return {
+        tid: {'counts': counts[tid], 'last_task': last_tasks.get(tid)}
+        for tid in technician_ids
+    }
+
+
+def daily_order_overview(start, end):
+    """
+    Órdenes activas creadas en [start, end) y cifras del panel del supervisor.
+
+    Las cifras salen del resumen diario (dimensión 'orders'): total_orders y
+    completed_today del documento del día, active_orders y pending_orders
+    (abiertas de cualquier día) del acumulado. Devuelve (órdenes_del_día, stats).
+    """
+    orders = list(extensions.db.service_orders.find(
+        {'is_active': True, 'created_at': {'$gte': start, '$lt': end}},
+        {'order_number': 1, 'status': 1, 'created_at': 1, 'vehicle_id': 1}
+    ).sort('created_at', -1))
+    today = get_stats('orders', day=start)
+    open_counts = get_stats('orders')
+    stats = {
+        'total_orders': sum(today.values()),
+        'active_orders': open_counts['in_progress'],
+        'completed_today': today['completed'],
+        'pending_orders': open_counts['pending'],
+    }
+    return orders, stats
+
+
+# Órdenes de un técnico -------------------------------------------------------
+
+# Máximo de órdenes completadas que muestran las vistas del técnico; las
+# órdenes con tareas pendientes o en progreso se muestran siempre
+TECHNICIAN_ORDERS_LIMIT = 100
+
+_OPEN_TASKS = {'$or': [{'pending': {'$gt': 0}}, {'in_progress': {'$gt': 0}}]}
+_NO_OPEN_TASKS = {'pending': 0, 'in_progress': 0}
+
+
+def _technician_task_match(technician_id, start, end):
+    match = {'technician_id': ObjectId(technician_id)}
+    if start or end:
+        match['created_at'] = {}
+        if start:
+            match['created_at']['$gte'] = start
+        if end:
+            match['created_at']['$lt'] = end
+    return match
+
+
+def _active_order_stages():
+    """Busca la orden de cada grupo (_id = order_id) y descarta las inactivas."""
+    return [
+        {'$lookup': {'from': 'service_orders', 'localField': '_id', 'foreignField': '_id', 'as': 'order'}},
+        {'$unwind': '$order'},
+        {'$match': {'order.is_active': True}},
+    ]
+
+
+def _technician_order_rows(match, counts_filter, limit=None):
+    """Órdenes del técnico cuyos conteos cumplen `counts_filter`, más recientes primero."""
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'created_at': 1}},
+        {'$group': dict(
+            {'_id': '$order_id',
+             'tasks': {'$push': {
+                 '_id': '$_id',
+                 'description': {'$ifNull': ['$description', '']},
+                 'status': {'$ifNull': ['$status', 'pending']},
+             }}},
+            **{s: _status_sum(s) for s in TASK_STATUSES}
+        )},
+        {'$match': counts_filter},
+        *_active_order_stages(),
+        {'$sort': {'order.created_at': -1}},
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+    pipeline += [
+        {'$lookup': {'from': 'users', 'localField': 'order.client_id', 'foreignField': '_id', 'as': 'client'}},
+        {'$lookup': {'from': 'vehicles', 'localField': 'order.vehicle_id', 'foreignField': '_id', 'as': 'vehicle'}},
+        {'$set': {'client': {'$arrayElemAt': ['$client', 0]},
+                  'vehicle': {'$arrayElemAt': ['$vehicle', 0]}}},
+        {'$project': {
+            'order_number': '$order.order_number',
+            'status': '$order.status',
+            'created_at': '$order.created_at',
+            'client_id': '$order.client_id',
+            'vehicle_id': '$order.vehicle_id',
+            'tasks': 1,
+            'task_counts': {s: f'${s}' for s in TASK_STATUSES},
+            'client.name': 1,
+            'vehicle.plate': 1, 'vehicle.make': 1, 'vehicle.model': 1,
+        }},
+    ]
+    rows = list(extensions.db.service_tasks.aggregate(pipeline))
+    for row in rows:
+        row['client'] = row.get('client') or {}
+        row['vehicle'] = row.get('vehicle') or {}
+    return rows
+
+
+def technician_orders(technician_id, start=None, end=None, limit=TECHNICIAN_ORDERS_LIMIT):
+    """
+    Órdenes activas en las que trabaja un técnico, partiendo de sus tareas.
+
+    Filtra `service_tasks` por `technician_id` (y `created_at` en [start, end)
+    si se indica) sobre el índice (technician_id, created_at), agrupa por
+    orden y solo entonces busca la orden, el cliente y el vehículo. Los
+    conteos por estado se calculan en la base de datos.
+
+    Devuelve las órdenes más recientes primero, cada una con `tasks` (solo
+    las del técnico y solo los campos que muestran las vistas),
+    `task_counts`, `client` y `vehicle`: todas las que tienen tareas
+    pendientes o en progreso del técnico y hasta `limit` de las demás. Los
+    totales del técnico están en el resumen diario (dimensión 'technician').
+    """
+    match = _technician_task_match(technician_id, start, end)
+
+    orders = _technician_order_rows(match, _OPEN_TASKS)
+    orders += _technician_order_rows(match, _NO_OPEN_TASKS, limit)
+    orders.sort(key=lambda o: o.get('created_at') or datetime.min, reverse=True)
+    return orders
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,4 +10,39 @@ class Config:
     DEBUG = False
     TESTING = False
     CSRF_ENABLED = True
-    PERMANENT_SESSION_LIFETIME = 1800
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = 1800
+    # Números de orden reservados por proceso en cada viaje a MongoDB (1 = sin huecos)
+    ORDER_NUMBER_BLOCK_SIZE = int(os.getenv('ORDER_NUMBER_BLOCK_SIZE', 1))
+    # Usar transacciones multi-documento cuando MongoDB las soporte (replica set)
+    MONGO_TRANSACTIONS = os.getenv('MONGO_TRANSACTIONS', '1') == '1'
+    # Meses de la serie de órdenes del dashboard del administrador (6, 12 o 24)
+    DASHBOARD_MONTHS = int(os.getenv('DASHBOARD_MONTHS', 6))
+    # Crear al arrancar, en segundo plano, los índices que falten
+    # (app/services/indexes.py); nunca con TESTING. ENSURE_INDEXES=0 para
+    # crearlos solo con `flask db ensure-indexes`.
+    ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', '1') == '1'
+    # Dashboards: segundos que un valor cacheado se considera fresco y máximo
+    # que se sirve vencido mientras se recalcula en segundo plano
+    DASHBOARD_FRESH_SECONDS = int(os.getenv('DASHBOARD_FRESH_SECONDS', 300))
+    DASHBOARD_STALE_SECONDS = int(os.getenv('DASHBOARD_STALE_SECONDS', 3600))
+    # Perfil de consultas MongoDB por petición (app/services/profiler.py):
+    # repeticiones de una misma consulta que se consideran N+1 y, en pruebas,
+    # máximo de consultas por endpoint ({'ordenes.list_ordenes': 8, ...})
+    QUERY_PROFILER = os.getenv('QUERY_PROFILER', '1') == '1'
+    QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+    QUERY_BUDGETS = {}
+    # Cabecera Server-Timing fuera de debug/pruebas (expone colecciones y conteos)
+    QUERY_SERVER_TIMING = os.getenv('QUERY_SERVER_TIMING', '0') == '1'
+    # Segundos que cada proceso conserva en memoria la identidad de la sesión
+    PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', 60))
+    # Cache compartida entre workers y servidores: Redis en CACHE_REDIS_URL.
+    # La invalidación por generaciones necesita una cache compartida con
+    # `inc` atómico, y el candado de recálculo de los dashboards
+    # (app/services/refresh.py) necesita que `add` sea atómico. Para
+    # desarrollo con un solo proceso y sin Redis: CACHE_TYPE=SimpleCache.
+    # FileSystemCache se comparte entre workers, pero `add` e `inc` no son atómicos.
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'RedisCache')
+    CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'vehiculos-cache'))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_THRESHOLD = int(os.getenv('CACHE_THRESHOLD', 2000))
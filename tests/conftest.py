@@ -1,24 +1,52 @@
+import os
+
 import mongomock
 import pytest
-from app import app as flask_app
+
+# Antes de importar la app: cache en memoria y sin crear índices al arrancar
+os.environ.setdefault('CACHE_TYPE', 'SimpleCache')
+os.environ.setdefault('ENSURE_INDEXES', '0')
+
+# Las rutas guardan `db` al importarse: el cliente debe ser mongomock desde el inicio
+with mongomock.patch(servers=(('localhost', 27017),)):
+    from app._init_ import app as flask_app
+
 from app import extensions
+from app.services.principals import invalidate_principal
+
+_db = extensions.db
+
 
 @pytest.fixture
 def app():
-    # Crear cliente mongomock
-    mongo_client = mongomock.MongoClient()
-    # Sustituir el cliente y la base global
-    extensions.mongo = mongo_client
-    extensions.db = mongo_client["vehiculos_test"]
+    # Base vacía (la misma que usan las rutas) y caches limpias en cada prueba
+    extensions.db = _db
+    for name in _db.list_collection_names():
+        _db.drop_collection(name)
+    invalidate_principal()
 
     # Configuración de la app de pruebas
     flask_app.config.update({
         "TESTING": True,
-        "MONGO_URI": "mongomock://localhost/vehiculos_test",
         "WTF_CSRF_ENABLED": False,
     })
-    yield flask_app
+    with flask_app.app_context():
+        extensions.cache.clear()
+        yield flask_app
 
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+@pytest.fixture
+def login(client):
+    """Inicia sesión en `client` con un usuario nuevo del rol dado; devuelve su _id."""
+    def _login(role, name='Usuario'):
+        user_id = extensions.db.users.insert_one({
+            'name': name, 'role': role, 'is_active': True, 'password_changed': True,
+        }).inserted_id
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return user_id
+    return _login
@@ -0,0 +1,29 @@
+from bson import ObjectId
+
+from app import extensions
+from app.commands import normalize_references_command
+
+
+def test_normalize_references(app):
+    db = extensions.db
+    client, vehicle, tech = ObjectId(), ObjectId(), ObjectId()
+    order_id = db.service_orders.insert_one({
+        'client_id': str(client), 'vehicle_id': vehicle, 'technician_ids': [str(tech), tech],
+    }).inserted_id
+    db.service_tasks.insert_many([
+        {'order_id': str(order_id), 'technician_id': str(tech)},
+        {'order_id': order_id, 'technician_id': 'no-es-un-id'},
+    ])
+    db.vehicles.insert_one({'plate': 'ABC', 'relations': [{'client_id': str(client), 'is_active': True}]})
+
+    result = app.test_cli_runner().invoke(normalize_references_command, ['--batch-size', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'technician_id=1' in result.output
+
+    order = db.service_orders.find_one({'_id': order_id})
+    assert order['client_id'] == client and order['technician_ids'] == [tech, tech]
+    assert db.service_tasks.count_documents({'order_id': order_id, 'technician_id': tech}) == 1
+    assert db.vehicles.find_one()['relations'][0]['client_id'] == client
+    # Valores inválidos se informan y se dejan como están
+    assert db.service_tasks.count_documents({'technician_id': 'no-es-un-id'}) == 1
+    assert db.migrations.count_documents({}) == 0
@@ -0,0 +1,67 @@
+import threading
+from datetime import datetime
+
+from app import extensions
+from app.services.counters import OrderNumberAllocator
+
+
+def _allocate_concurrently(workers, per_worker, block_size, now):
+    """Cada hilo usa su propio asignador, como si fuera un proceso WSGI distinto."""
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        allocator = OrderNumberAllocator(block_size)
+        local = [allocator.next(now) for _ in range(per_worker)]
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_counters_single_round_trip_document(app):
+    now = datetime(2025, 3, 10)
+    assert OrderNumberAllocator().next(now) == (1, 1, 2025, 3)
+    assert OrderNumberAllocator().next(now) == (2, 2, 2025, 3)
+
+    doc = extensions.db.order_counters.find_one({'_id': 'year:2025'})
+    assert doc['yearly_counter'] == 2
+    assert doc['months'] == {'03': 2}
+
+
+def test_counters_month_resets_year_continues(app):
+    allocator = OrderNumberAllocator()
+    allocator.next(datetime(2025, 1, 31))
+    assert allocator.next(datetime(2025, 2, 1)) == (1, 2, 2025, 2)
+
+
+def test_concurrent_counters_no_gaps_or_duplicates(app, monkeypatch):
+    # mongomock no es atómico entre hilos; se emula la atomicidad de MongoDB
+    # en find_one_and_update para que la prueba dependa solo del asignador
+    collection_cls = type(extensions.db.order_counters)
+    original = collection_cls.find_one_and_update
+    server_lock = threading.Lock()
+
+    def atomic_find_one_and_update(self, *args, **kwargs):
+        with server_lock:
+            return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_cls, 'find_one_and_update', atomic_find_one_and_update)
+
+    now = datetime(2025, 5, 20)
+    for block_size in (1, 4):
+        extensions.db.order_counters.delete_many({})
+        # 8 trabajadores x 20 números: con bloques de 4 se consumen todos los reservados
+        results = _allocate_concurrently(workers=8, per_worker=20, block_size=block_size, now=now)
+
+        monthly = sorted(r[0] for r in results)
+        yearly = sorted(r[1] for r in results)
+        assert monthly == list(range(1, 161))
+        assert yearly == list(range(1, 161))
+        # Cada orden recibe el par (mensual, anual) reservado en la misma operación
+        assert all(m == y for m, y, _, _ in results)
@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask
+from flask_caching import Cache
+
+from app import extensions
+from app.services import generations
+from app.services.generations import bump_generation, generation
+
+
+def test_bump_changes_only_its_domain(app):
+    orders, vehicles = generation('orders'), generation('vehicles')
+    bump_generation('orders')
+    assert generation('orders') == orders + 1
+    assert generation('vehicles') == vehicles
+
+    with pytest.raises(ValueError):
+        bump_generation('facturas')
+
+
+def test_concurrent_bumps_are_not_lost(app, monkeypatch):
+    before = generation('orders')
+    read = generations.generation
+
+    def racing_generation(domain):
+        # Otro worker incrementa entre la lectura y la escritura de este
+        value = read(domain)
+        extensions.cache.cache.inc(generations._generation_key(domain))
+        return value
+
+    monkeypatch.setattr(generations, 'generation', racing_generation)
+    bump_generation('orders')
+    assert read('orders') == before + 2
+
+
+def test_generation_shared_between_workers(tmp_path, monkeypatch):
+    # Dos "workers" (apps con su propia instancia de Cache) sobre el mismo directorio
+    config = {'CACHE_TYPE': 'FileSystemCache', 'CACHE_DIR': str(tmp_path)}
+    workers = []
+    for name in ('w1', 'w2'):
+        cache = Cache()
+        app = Flask(name)
+        cache.init_app(app, config=config)
+        workers.append((app, cache))
+
+    def in_worker(index, fn):
+        app, cache = workers[index]
+        monkeypatch.setattr(extensions, 'cache', cache)
+        with app.app_context():
+            return fn()
+
+    before = in_worker(1, lambda: generation('orders'))
+    in_worker(1, lambda: bump_generation('orders'))
+    assert in_worker(0, lambda: generation('orders')) == before + 1
@@ -0,0 +1,31 @@
+from app import extensions
+from app.commands import ensure_indexes_command, verify_indexes_command
+from app.services.indexes import INDEXES, ensure_indexes, verify_indexes
+
+
+def test_ensure_creates_declared_indexes_once(app):
+    created = ensure_indexes()
+    assert set(created) == set(INDEXES)
+    info = extensions.db.service_orders.index_information()
+    assert info['assigned_vendor_id_1_created_at_-1_active']['partialFilterExpression'] == {'is_active': True}
+    assert 'order_number_1' in info
+    assert ensure_indexes() == {}
+
+
+def test_verify_reports_missing_and_undeclared(app):
+    db = extensions.db
+    db.users.create_index([('role', 1), ('is_active', 1), ('cedula', 1)])
+    db.vehicles.create_index([('plate', 1)])   # sin unique
+    report = verify_indexes()
+    assert 'cedula_1' in report['users']['missing']
+    assert report['users']['undeclared'] == ['role_1_is_active_1_cedula_1']
+    assert report['vehicles']['different'] == ['plate_1']
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(verify_indexes_command)
+    assert result.exit_code == 1 and 'no declarados' in result.output
+
+    db.vehicles.drop_index('plate_1')
+    assert runner.invoke(ensure_indexes_command).exit_code == 0
+    result = runner.invoke(verify_indexes_command)
+    assert result.exit_code == 0, result.output
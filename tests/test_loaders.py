@@ -0,0 +1,24 @@
+from bson import ObjectId
+
+from app import extensions
+from app.services.loaders import get_user, load_users
+
+
+def test_identity_map_memoizes_per_request(app):
+    db = extensions.db
+    ana = db.users.insert_one({'name': 'Ana'}).inserted_id
+    luis = db.users.insert_one({'name': 'Luis'}).inserted_id
+    missing = ObjectId()
+
+    with app.app_context():
+        users = load_users([ana, str(luis), missing, None])
+        assert {u['name'] for u in users.values()} == {'Ana', 'Luis'}
+
+        # Ya cargados: no se vuelve a consultar (ni siquiera los inexistentes)
+        db.users.delete_many({})
+        assert get_user(str(ana))['name'] == 'Ana'
+        assert get_user(missing) is None
+
+    with app.app_context():
+        # Nueva petición, mapa vacío
+        assert get_user(ana) is None
@@ -0,0 +1,94 @@
+from app import extensions
+
+
+def _order_with_task(status):
+    db = extensions.db
+    order_id = db.service_orders.insert_one({
+        'is_active': True, 'status': status,
+        'task_counts': {'pending': 0, 'in_progress': 0, 'completed': 0, status: 1},
+    }).inserted_id
+    task_id = db.service_tasks.insert_one({'order_id': order_id, 'status': status}).inserted_id
+    return order_id, task_id
+
+
+def test_technician_update_ignores_tasks_of_other_orders(client, login):
+    login('tecnico')
+    order_a, _ = _order_with_task('pending')
+    order_b, task_b = _order_with_task('pending')
+    orders_before = {o['_id']: o for o in extensions.db.service_orders.find()}
+
+    rv = client.post(f'/ordenes/actualizar-tareas-tecnico/{order_a}',
+                     data={f'task-{task_b}': 'completed'})
+    assert rv.status_code == 302
+
+    assert extensions.db.service_tasks.find_one({'_id': task_b})['status'] == 'pending'
+    for order_id in (order_a, order_b):
+        order = extensions.db.service_orders.find_one({'_id': order_id})
+        assert order['task_counts'] == orders_before[order_id]['task_counts']
+        assert order['status'] == 'pending'
+
+
+def test_quick_order_reuses_vehicle_created_concurrently(client, login, monkeypatch):
+    from pymongo.errors import DuplicateKeyError
+    from app.routes import ordenes
+
+    login('administrador')
+    extensions.db.users.insert_one({'name': 'Tec', 'role': 'tecnico', 'is_active': True})
+    client_id = extensions.db.users.insert_one({'name': 'Ana', 'role': 'cliente'}).inserted_id
+    existing = {'plate': 'AÑ-123', 'plate_key': 'AÑ123', 'is_active': True,
+                'relations': [{'client_id': client_id, 'is_active': True}]}
+
+    # Otra petición inserta el mismo vehículo entre la búsqueda y la inserción
+    vehicles = ordenes.db.vehicles
+    find_one = vehicles.find_one
+    calls = []
+
+    def racing_find_one(*args, **kwargs):
+        calls.append(1)
+        return None if len(calls) == 1 else find_one(*args, **kwargs)
+
+    def racing_insert_one(doc):
+        vehicles.insert_many([dict(existing)])
+        raise DuplicateKeyError('E11000 plate_key')
+
+    monkeypatch.setattr(vehicles, 'find_one', racing_find_one)
+    monkeypatch.setattr(vehicles, 'insert_one', racing_insert_one)
+
+    rv = client.post('/ordenes/nueva', data={'quick_search': 'añ-123'})
+    assert rv.status_code == 302
+    assert extensions.db.vehicles.count_documents({}) == 1
+    order = extensions.db.service_orders.find_one()
+    assert order['vehicle_id'] == extensions.db.vehicles.find_one()['_id']
+    assert order['client_id'] == client_id
+
+
+def test_quick_order_uses_legacy_vehicle_without_plate_key(client, login):
+    from app.services.indexes import ensure_indexes
+
+    ensure_indexes()
+    login('administrador')
+    extensions.db.users.insert_one({'name': 'Tec', 'cedula': '1', 'role': 'tecnico', 'is_active': True})
+    # Vehículo anterior a plate_key: solo lo encuentra el índice único de plate
+    legacy = extensions.db.vehicles.insert_one({'plate': 'ABC-123', 'is_active': True}).inserted_id
+
+    rv = client.post('/ordenes/nueva', data={'quick_search': 'ABC-123'})
+    assert rv.status_code == 302
+    assert extensions.db.vehicles.count_documents({}) == 1
+    assert extensions.db.service_orders.find_one()['vehicle_id'] == legacy
+
+
+def test_order_detail_pipeline_joins_relations(app):
+    from app.routes.ordenes import order_detail_pipeline
+
+    db = extensions.db
+    client_id = db.users.insert_one({'name': 'Ana', 'role': 'cliente', 'password': 'hash'}).inserted_id
+    vehicle_id = db.vehicles.insert_one({'plate': 'ABC-123'}).inserted_id
+    order_id = db.service_orders.insert_one({
+        'client_id': client_id, 'vehicle_id': vehicle_id, 'created_by': None, 'is_active': True,
+    }).inserted_id
+    db.service_tasks.insert_one({'order_id': order_id, 'status': 'pending'})
+
+    order = next(db.service_orders.aggregate(order_detail_pipeline(order_id)))
+    assert order['client']['name'] == 'Ana' and 'password' not in order['client']
+    assert order['vehicle']['plate'] == 'ABC-123'
+    assert len(order['tasks']) == 1
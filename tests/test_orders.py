@@ -0,0 +1,60 @@
+from bson import ObjectId
+
+from app import extensions
+from app.services.orders import apply_task_deltas, recount_order_tasks, save_order_tasks, task_deltas
+
+
+def _new_order():
+    return extensions.db.service_orders.insert_one({
+        'status': 'pending',
+        'task_counts': {'pending': 0, 'in_progress': 0, 'completed': 0},
+    }).inserted_id
+
+
+def test_task_deltas():
+    changes = [(None, 'pending'), ('pending', 'completed'), ('in_progress', None), ('x', 'completed')]
+    assert task_deltas(changes) == {'pending': -1, 'completed': 2, 'in_progress': -1}
+
+
+def test_status_follows_counters(app):
+    order_id = _new_order()
+
+    assert apply_task_deltas(order_id, task_deltas([(None, 'pending'), (None, 'pending')])) == ('pending', 'pending')
+    assert apply_task_deltas(order_id, task_deltas([('pending', 'in_progress')])) == ('pending', 'in_progress')
+    assert apply_task_deltas(order_id, task_deltas([('in_progress', 'completed'), ('pending', 'completed')])) == ('in_progress', 'completed')
+    assert apply_task_deltas(order_id, task_deltas([('completed', None)])) == ('completed', 'completed')
+
+    order = extensions.db.service_orders.find_one({'_id': order_id})
+    assert order['status'] == 'completed'
+    assert order['task_counts'] == {'pending': 0, 'in_progress': 0, 'completed': 1}
+
+
+def test_legacy_order_is_recounted(app):
+    order_id = extensions.db.service_orders.insert_one({'status': 'pending'}).inserted_id
+    extensions.db.service_tasks.insert_many([
+        {'order_id': order_id, 'status': 'completed'},
+        {'order_id': order_id, 'status': 'in_progress'},
+    ])
+
+    assert apply_task_deltas(order_id, {'in_progress': 1}) == ('pending', 'in_progress')
+    assert extensions.db.service_orders.find_one({'_id': order_id})['task_counts']['completed'] == 1
+    assert recount_order_tasks(order_id) == 'in_progress'
+
+
+def test_save_order_tasks_bulk(app):
+    order_id = _new_order()
+    tech = ObjectId()
+    keep = extensions.db.service_tasks.insert_one({'order_id': order_id, 'technician_id': tech, 'status': 'pending'}).inserted_id
+    drop = extensions.db.service_tasks.insert_one({'order_id': order_id, 'technician_id': tech, 'status': 'pending'}).inserted_id
+    apply_task_deltas(order_id, {'pending': 2})
+
+    old, new, skipped = save_order_tasks(
+        order_id, [str(drop)], {str(keep): {'status': 'completed'}}, [('Nueva', None)]
+    )
+
+    assert (old, new, skipped) == ('pending', 'pending', 0)
+    order = extensions.db.service_orders.find_one({'_id': order_id})
+    assert order['task_counts'] == {'pending': 1, 'in_progress': 0, 'completed': 1}
+    unassigned = extensions.db.users.find_one({'name': 'Sin asignar'})
+    assert order['technician_ids'] == [tech, unassigned['_id']]
+    assert extensions.db.service_tasks.count_documents({'order_id': order_id}) == 2
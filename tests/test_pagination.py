@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from app import extensions
+from app.services.pagination import keyset_facet
+
+
+def test_keyset_facet_pages_and_counts(app):
+    orders = extensions.db.service_orders
+    base = datetime(2025, 3, 1)
+    orders.insert_many([
+        {'is_active': True, 'status': 'pending' if i % 2 else 'completed', 'created_at': base + timedelta(hours=i)}
+        for i in range(5)
+    ] + [{'is_active': False, 'status': 'pending', 'created_at': base}])
+    facets = {
+        'total': [{'$count': 'count'}],
+        'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+    }
+
+    page1, next_cursor, prev_cursor, result = keyset_facet(
+        orders, {'is_active': True}, 'created_at', -1, per_page=2, facets=facets)
+    assert [o['created_at'].hour for o in page1] == [4, 3]
+    assert prev_cursor is None
+    assert result['total'] == [{'count': 5}]
+    assert {r['_id']: r['count'] for r in result['by_status']} == {'pending': 2, 'completed': 3}
+
+    page2, _, prev_cursor, result = keyset_facet(
+        orders, {'is_active': True}, 'created_at', -1, after=next_cursor, per_page=2, facets=facets)
+    assert [o['created_at'].hour for o in page2] == [2, 1]
+    # Los conteos no dependen del cursor
+    assert result['total'] == [{'count': 5}]
+
+    back, _, _, _ = keyset_facet(orders, {'is_active': True}, 'created_at', -1, before=prev_cursor, per_page=2)
+    assert back == page1
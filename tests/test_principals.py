@@ -0,0 +1,37 @@
+import time
+
+from bson import ObjectId
+
+from app import extensions
+from app.services.principals import TTLCache, get_principal, invalidate_principal
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')            # 'a' pasa a ser el más reciente
+    cache.set('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+
+    cache.set('d', 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('d') is None
+
+
+def test_principal_cached_until_invalidated(app):
+    users = extensions.db.users
+    user_id = users.insert_one({'name': 'Ana', 'role': 'tecnico', 'password_changed': False}).inserted_id
+    invalidate_principal()
+
+    with app.app_context():
+        assert get_principal(str(user_id)) == {'role': 'tecnico', 'name': 'Ana', 'password_changed': False}
+
+    users.update_one({'_id': user_id}, {'$set': {'password_changed': True}})
+    with app.app_context():
+        # Sin consultar MongoDB: sigue la versión cacheada
+        assert get_principal(str(user_id))['password_changed'] is False
+        invalidate_principal(user_id)
+        assert get_principal(str(user_id))['password_changed'] is True
+
+    assert get_principal(str(ObjectId())) is None
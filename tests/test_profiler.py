@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app.services.profiler import (QueryBudgetExceeded, command_profiler, command_shape,
+                                   init_query_profiler, query_budget)
+
+
+def _run(name, command, ms=2.0, request_id=[0]):
+    # Eventos como los que pymongo entrega al CommandListener
+    request_id[0] += 1
+    event = SimpleNamespace(command_name=name, command=command, connection_id=('db', 27017),
+                            request_id=request_id[0], duration_micros=int(ms * 1000))
+    command_profiler.started(event)
+    command_profiler.succeeded(event)
+
+
+def test_command_shape_ignores_values():
+    assert command_shape('find', {'find': 'users', 'filter': {'_id': 1, 'role': 'x'}}) == \
+        command_shape('find', {'find': 'users', 'filter': {'role': 'y', '_id': 2}})
+    assert command_shape('find', {'find': 'users', 'filter': {'_id': {'$in': [1]}}}) == ('users', 'find _id.$in')
+    assert command_shape('aggregate', {'aggregate': 'service_orders', 'pipeline': [
+        {'$match': {'is_active': True}}, {'$group': {'_id': '$status'}}]}) == \
+        ('service_orders', 'aggregate $match(is_active) | $group')
+    assert command_shape('ping', {'ping': 1}) == (None, None)
+
+
+def test_request_profile_header_and_budget():
+    app = Flask('profiler')
+    app.testing = True
+    app.config['QUERY_REPEAT_THRESHOLD'] = 2
+    app.config['QUERY_BUDGETS'] = {'vista': 3}
+    init_query_profiler(app)
+
+    @app.route('/vista/<int:n>', endpoint='vista')
+    def vista(n):
+        _run('find', {'find': 'service_orders', 'filter': {'is_active': True}})
+        for i in range(n):
+            _run('find', {'find': 'users', 'filter': {'_id': i}})
+        return 'ok'
+
+    client = app.test_client()
+    response = client.get('/vista/2')
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('mongo;dur=6.0;desc="3 consultas"')
+    assert 'mongo-users;dur=4.0;desc="2"' in timing
+
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/vista/3')
+
+    # Fuera de debug y pruebas la cabecera no se envía
+    app.testing = False
+    app.config['QUERY_BUDGETS'] = {}
+    assert 'Server-Timing' not in client.get('/vista/1').headers
+
+
+def test_query_budget_flags_repeated_shapes():
+    with query_budget(max_queries=5) as profile:
+        _run('find', {'find': 'users', 'filter': {'_id': 1}})
+        _run('find', {'find': 'users', 'filter': {'_id': {'$in': [1, 2]}}})
+    assert profile.count == 2
+
+    with pytest.raises(QueryBudgetExceeded, match='N\\+1'):
+        with query_budget(max_repeats=1):
+            for i in range(3):
+                _run('find', {'find': 'vehicles', 'filter': {'_id': i}})
@@ -0,0 +1,62 @@
+import threading
+
+from app.services import refresh
+from app.services.generations import bump_generation
+from app.services.refresh import stale_while_revalidate
+
+
+def _counter():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return len(calls)
+    return build, calls
+
+
+def test_serves_stale_value_and_refreshes_in_background(app):
+    build, calls = _counter()
+    assert stale_while_revalidate('stats', ('orders',), build) == 1
+    assert stale_while_revalidate('stats', ('orders',), build) == 1
+
+    bump_generation('orders')
+    # Vencido: se sirve el valor anterior y un hilo lo recalcula
+    assert stale_while_revalidate('stats', ('orders',), build) == 1
+    thread = refresh._refreshes.get('stats')
+    if thread is not None:
+        thread.join(5)
+    assert calls == [1, 1]
+    assert stale_while_revalidate('stats', ('orders',), build) == 2
+
+
+def test_single_refresh_while_one_is_running(app):
+    release = threading.Event()
+    calls = []
+
+    def slow_build():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    assert stale_while_revalidate('slow', ('orders',), slow_build) == 1
+    bump_generation('orders')
+    for _ in range(5):
+        assert stale_while_revalidate('slow', ('orders',), slow_build) == 1
+    thread = refresh._refreshes.get('slow')
+    release.set()
+    if thread is not None:
+        thread.join(5)
+    assert len(calls) == 2
+
+
+def test_cold_start_waits_for_running_build(app):
+    # Otro worker tiene el candado: esta petición espera su resultado
+    token = refresh._acquire('cold')
+
+    def finish():
+        with app.app_context():
+            refresh._build_and_store('cold', ('orders',), lambda: 'de otro worker', 60)
+            refresh._release('cold', token)
+    threading.Timer(0.1, finish).start()
+    assert stale_while_revalidate('cold', ('orders',), lambda: 'propio') == 'de otro worker'
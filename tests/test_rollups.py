@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from app import extensions
+from app.commands import rebuild_daily_stats
+from app.services.orders import save_order_tasks
+from app.services.rollups import get_stats, get_stats_many, order_changes, record_changes
+
+
+def _snapshot():
+    """Conteos distintos de cero por documento, para comparar resúmenes."""
+    snapshot = {}
+    for doc in extensions.db.daily_stats.find():
+        counts = {s: n for s, n in doc['status'].items() if n}
+        if counts:
+            snapshot[doc['_id']] = counts
+    return snapshot
+
+
+def test_record_changes_day_and_total(app):
+    vendor = ObjectId()
+    order = {'created_at': datetime(2025, 3, 10, 9), 'assigned_vendor_id': vendor}
+    record_changes(order_changes(order, None, 'pending'))
+    record_changes(order_changes(order, 'pending', 'completed'))
+
+    assert get_stats('orders', day=datetime(2025, 3, 10)) == {'pending': 0, 'in_progress': 0, 'completed': 1}
+    assert get_stats('vendor', vendor)['completed'] == 1
+    assert get_stats('orders', day='2025-03-11') == {'pending': 0, 'in_progress': 0, 'completed': 0}
+
+
+def test_incremental_matches_rebuild(app):
+    vendor, tech = ObjectId(), ObjectId()
+    created = datetime(2025, 4, 2, 8)
+    order_id = extensions.db.service_orders.insert_one({
+        'status': 'pending', 'is_active': True, 'created_at': created,
+        'assigned_vendor_id': vendor,
+        'task_counts': {'pending': 0, 'in_progress': 0, 'completed': 0},
+    }).inserted_id
+    record_changes(order_changes({'created_at': created, 'assigned_vendor_id': vendor}, None, 'pending'))
+
+    save_order_tasks(order_id, [], {}, [('Frenos', tech), ('Aceite', tech)], use_transaction=False)
+    task_ids = [t['_id'] for t in extensions.db.service_tasks.find({'order_id': order_id})]
+    save_order_tasks(order_id, [str(task_ids[1])],
+                     {str(task_ids[0]): {'status': 'completed'}}, [], use_transaction=False)
+
+    today = datetime.now()
+    assert get_stats('orders', day=created)['completed'] == 1
+    assert get_stats_many('technician', [tech], day=today)[tech] == {'pending': 0, 'in_progress': 0, 'completed': 1}
+
+    incremental = _snapshot()
+    result = app.test_cli_runner().invoke(rebuild_daily_stats)
+    assert result.exit_code == 0, result.output
+    assert _snapshot() == incremental
+
+
+def test_deleted_order_leaves_technician_totals(client, login, app):
+    login('administrador')
+    tech = ObjectId()
+    created = datetime(2025, 4, 2, 8)
+    order_id = extensions.db.service_orders.insert_one({
+        'status': 'pending', 'is_active': True, 'created_at': created,
+        'task_counts': {'pending': 0, 'in_progress': 0, 'completed': 0},
+    }).inserted_id
+    record_changes(order_changes({'created_at': created}, None, 'pending'))
+    save_order_tasks(order_id, [], {}, [('Frenos', tech)], use_transaction=False)
+    assert get_stats('technician', tech)['pending'] == 1
+
+    rv = client.post(f'/ordenes/eliminar/{order_id}')
+    assert rv.status_code == 302
+    assert get_stats('technician', tech) == {'pending': 0, 'in_progress': 0, 'completed': 0}
+
+    incremental = _snapshot()
+    result = app.test_cli_runner().invoke(rebuild_daily_stats)
+    assert result.exit_code == 0, result.output
+    assert _snapshot() == incremental
+
+
+def test_clearing_orders_rebuilds_daily_stats(client, login):
+    login('administrador')
+    created = datetime(2025, 4, 2, 8)
+    extensions.db.service_orders.insert_one({'status': 'pending', 'is_active': True, 'created_at': created})
+    record_changes(order_changes({'created_at': created}, None, 'pending'))
+
+    rv = client.post('/usuarios/administrador/borrar_tablas', data={'colecciones': ['service_orders']})
+    assert rv.status_code == 302
+    assert get_stats('orders') == {'pending': 0, 'in_progress': 0, 'completed': 0}
@@ -0,0 +1,56 @@
+from app import extensions
+from app.services.search import normalize_plate, name_tokens, search_clients, search_people
+
+
+def test_normalize_plate():
+    assert normalize_plate("abc-123") == "ABC123"
+    assert normalize_plate(" Abc 123 ") == "ABC123"
+    assert normalize_plate(None) == ""
+    # Las letras no ASCII se conservan: placas distintas, claves distintas
+    assert normalize_plate("añ-123") == "AÑ123"
+    assert normalize_plate("AÑ123") != normalize_plate("AN123")
+
+
+def test_search_people_prefix_and_accents(app):
+    for name in ["María González", "Mario Marín", "José Pérez"]:
+        extensions.db.users.insert_one({
+            "name": name, "name_tokens": name_tokens(name),
+            "role": "cliente", "is_active": True,
+        })
+
+    assert [u["name"] for u in search_people("cliente", "maria")] == ["María González"]
+    assert [u["name"] for u in search_people("cliente", "mar gon")] == ["María González"]
+    assert [u["name"] for u in search_people("cliente", "PEREZ")] == ["José Pérez"]
+    assert len(search_people("cliente", "mar", limit=1)) == 1
+
+
+def test_search_people_ranks_before_limit(app):
+    # Muchos nombres alfabéticamente anteriores que solo coinciden por prefijo
+    names = [f"Aaron Marcano {i:02d}" for i in range(10)] + ["Zoe Mar"]
+    extensions.db.users.insert_many([
+        {"name": n, "name_tokens": name_tokens(n), "role": "cliente", "is_active": True}
+        for n in names
+    ])
+
+    assert [u["name"] for u in search_people("cliente", "mar", limit=2)][0] == "Zoe Mar"
+
+
+def test_search_clients_by_cedula_and_name(app):
+    users = extensions.db.users
+    users.insert_many([
+        {'role': 'cliente', 'is_active': True, 'name': 'Ana Pérez', 'cedula': '1002003',
+         'name_tokens': name_tokens('Ana Pérez')},
+        {'role': 'cliente', 'is_active': True, 'name': 'Luis Díaz', 'cedula': '1009999',
+         'name_tokens': name_tokens('Luis Díaz')},
+        {'role': 'cliente', 'is_active': False, 'name': 'Ana Inactiva', 'cedula': '1002111',
+         'name_tokens': name_tokens('Ana Inactiva')},
+        {'role': 'tecnico', 'is_active': True, 'name': 'Ana Técnica', 'cedula': '1002222',
+         'name_tokens': name_tokens('Ana Técnica')},
+    ])
+
+    assert [c['name'] for c in search_clients('100')] == ['Ana Pérez', 'Luis Díaz']
+    assert [c['cedula'] for c in search_clients('1.002')] == ['1002003']
+    assert [c['name'] for c in search_clients('ana')] == ['Ana Pérez']
+    assert search_clients('100', limit=1) == [{'_id': search_clients('1002')[0]['_id'],
+                                               'name': 'Ana Pérez', 'cedula': '1002003'}]
+    assert search_clients('  ') == []
@@ -0,0 +1,151 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from app import extensions
+from app.commands import rebuild_daily_stats
+from app.services.rollups import get_stats
+from app.services.stats import (daily_order_overview, month_starts, monthly_order_series,
+                               technician_orders, technician_productivity, technician_workload)
+
+
+def _rebuild_rollup(app):
+    result = app.test_cli_runner().invoke(rebuild_daily_stats)
+    assert result.exit_code == 0, result.output
+
+
+def test_month_starts_calendar_boundaries():
+    starts, upper = month_starts(3, now=datetime(2025, 1, 31, 18))
+    assert starts == [datetime(2024, 11, 1), datetime(2024, 12, 1), datetime(2025, 1, 1)]
+    assert upper == datetime(2025, 2, 1)
+
+    starts, upper = month_starts(24, now=datetime(2025, 12, 1))
+    assert len(set(starts)) == 24
+    assert starts[0] == datetime(2024, 1, 1) and upper == datetime(2026, 1, 1)
+
+
+def test_monthly_order_series(app):
+    extensions.db.service_orders.insert_many([
+        {'created_at': datetime(2025, 2, 28, 23, 59, 59, 500000), 'is_active': True},
+        {'created_at': datetime(2025, 3, 31, 10), 'is_active': True},
+        {'created_at': datetime(2025, 3, 1), 'is_active': True},
+        {'created_at': datetime(2025, 3, 2), 'is_active': False},
+        {'created_at': datetime(2024, 9, 30), 'is_active': True},   # fuera del horizonte
+    ])
+
+    series = monthly_order_series(6, now=datetime(2025, 3, 31, 12))
+    assert [m['month'] for m in series] == ['Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
+    assert [m['orders'] for m in series] == [0, 0, 0, 0, 1, 2]
+
+    series = monthly_order_series(24, now=datetime(2025, 3, 31, 12))
+    assert series[-1]['month'] == 'Mar 25'
+    assert sum(m['orders'] for m in series) == 4
+
+
+def test_technician_productivity(app):
+    users = extensions.db.users
+    ana = users.insert_one({'role': 'tecnico', 'is_active': True, 'name': 'Ana'}).inserted_id
+    luis = users.insert_one({'role': 'tecnico', 'is_active': True, 'name': 'Luis'}).inserted_id
+    nadie = users.insert_one({'role': 'tecnico', 'is_active': True, 'name': 'Sin asignar'}).inserted_id
+    extensions.db.service_tasks.insert_many([
+        {'technician_id': ana, 'status': 'completed', 'created_at': datetime(2025, 3, 1)},
+        {'technician_id': ana, 'status': 'pending', 'created_at': datetime(2025, 3, 2)},
+        {'technician_id': ana, 'status': 'completed', 'created_at': datetime(2024, 1, 1)},
+        {'technician_id': luis, 'status': 'completed', 'created_at': datetime(2025, 3, 5)},
+        {'technician_id': nadie, 'status': 'pending', 'created_at': datetime(2025, 3, 5)},
+    ])
+
+    rows = technician_productivity()
+    assert [(r['name'], r['total_tasks'], r['completed_tasks']) for r in rows] == [('Ana', 3, 2), ('Luis', 1, 1)]
+
+    rows = technician_productivity(start=datetime(2025, 3, 2), end=datetime(2025, 4, 1))
+    assert [(r['name'], r['total_tasks'], r['completed_tasks']) for r in rows] == [('Ana', 1, 0), ('Luis', 1, 1)]
+
+
+def test_technician_workload(app):
+    tech, idle = ObjectId(), ObjectId()
+    order = extensions.db.service_orders.insert_one({'is_active': True}).inserted_id
+    start, end = datetime(2025, 3, 10), datetime(2025, 3, 11)
+    extensions.db.service_tasks.insert_many([
+        {'order_id': order, 'technician_id': tech, 'status': 'pending', 'description': 'Frenos',
+         'created_at': datetime(2025, 3, 10, 8)},
+        {'order_id': order, 'technician_id': tech, 'status': 'completed', 'description': 'Aceite',
+         'created_at': datetime(2025, 3, 10, 11)},
+        {'order_id': order, 'technician_id': tech, 'status': 'in_progress', 'description': 'Ayer',
+         'created_at': datetime(2025, 3, 9, 11)},
+    ])
+    _rebuild_rollup(app)
+
+    board = technician_workload([tech, idle], start, end)
+    assert board == {
+        tech: {'counts': {'pending': 1, 'in_progress': 0, 'completed': 1}, 'last_task': 'Aceite'},
+        idle: {'counts': {'pending': 0, 'in_progress': 0, 'completed': 0}, 'last_task': None},
+    }
+
+
+def test_daily_order_overview(app):
+    start, end = datetime(2025, 3, 10), datetime(2025, 3, 11)
+    extensions.db.service_orders.insert_many([
+        {'order_number': 'A', 'status': 'pending', 'is_active': True, 'created_at': datetime(2025, 3, 10, 9)},
+        {'order_number': 'B', 'status': 'completed', 'is_active': True, 'created_at': datetime(2025, 3, 10, 10)},
+        {'order_number': 'C', 'status': 'in_progress', 'is_active': True, 'created_at': datetime(2025, 3, 1)},
+        {'order_number': 'D', 'status': 'pending', 'is_active': False, 'created_at': datetime(2025, 3, 10, 11)},
+    ])
+    _rebuild_rollup(app)
+
+    orders, stats = daily_order_overview(start, end)
+    assert [o['order_number'] for o in orders] == ['B', 'A']
+    assert stats == {'total_orders': 2, 'active_orders': 1, 'completed_today': 1, 'pending_orders': 1}
+
+
+def test_technician_orders_from_tasks(app):
+    db = extensions.db
+    tech, other = ObjectId(), ObjectId()
+    client = db.users.insert_one({'name': 'Ana', 'role': 'cliente'}).inserted_id
+    vehicle = db.vehicles.insert_one({'plate': 'ABC123'}).inserted_id
+    open_order = db.service_orders.insert_one({
+        'order_number': 'ORD-1', 'status': 'in_progress', 'is_active': True,
+        'client_id': client, 'vehicle_id': vehicle, 'created_at': datetime(2025, 3, 1)
+    }).inserted_id
+    done_order = db.service_orders.insert_one({
+        'order_number': 'ORD-2', 'status': 'completed', 'is_active': True,
+        'created_at': datetime(2025, 3, 2)
+    }).inserted_id
+    inactive = db.service_orders.insert_one({'order_number': 'ORD-3', 'is_active': False}).inserted_id
+    db.service_tasks.insert_many([
+        {'order_id': open_order, 'technician_id': tech, 'status': 'pending', 'created_at': datetime(2025, 3, 1, 9),
+         'description': 'Frenos', 'observations': 'x' * 1000},
+        {'order_id': open_order, 'technician_id': tech, 'status': 'completed', 'created_at': datetime(2025, 3, 1, 10)},
+        {'order_id': open_order, 'technician_id': other, 'status': 'pending', 'created_at': datetime(2025, 3, 1, 9)},
+        {'order_id': done_order, 'technician_id': tech, 'status': 'completed', 'created_at': datetime(2025, 3, 2, 9)},
+        {'order_id': inactive, 'technician_id': tech, 'status': 'pending', 'created_at': datetime(2025, 3, 2, 9)},
+    ])
+
+    orders = technician_orders(tech)
+    assert [o['order_number'] for o in orders] == ['ORD-2', 'ORD-1']
+    ord1 = orders[1]
+    assert len(ord1['tasks']) == 2
+    assert ord1['tasks'][0] == {'_id': ord1['tasks'][0]['_id'], 'description': 'Frenos', 'status': 'pending'}
+    assert ord1['task_counts'] == {'pending': 1, 'in_progress': 0, 'completed': 1}
+    assert ord1['client']['name'] == 'Ana' and ord1['vehicle']['plate'] == 'ABC123'
+    assert orders[0]['client'] == {}
+
+    orders = technician_orders(tech, datetime(2025, 3, 2), datetime(2025, 3, 3))
+    assert [o['order_number'] for o in orders] == ['ORD-2']
+
+    # El límite solo recorta las completadas: la orden abierta, más antigua, sigue apareciendo
+    newer_done = db.service_orders.insert_one({
+        'order_number': 'ORD-4', 'status': 'completed', 'is_active': True,
+        'created_at': datetime(2025, 3, 3)
+    }).inserted_id
+    db.service_tasks.insert_one({'order_id': newer_done, 'technician_id': tech, 'status': 'completed',
+                                 'created_at': datetime(2025, 3, 3, 9)})
+    orders = technician_orders(tech, limit=1)
+    assert [o['order_number'] for o in orders] == ['ORD-4', 'ORD-1']
+
+    # Totales del técnico: el resumen diario no cuenta la orden inactiva
+    _rebuild_rollup(app)
+    assert get_stats('technician', tech) == {'pending': 1, 'in_progress': 0, 'completed': 3}
+    assert get_stats('technician', tech, day='2025-03-02') == {'pending': 0, 'in_progress': 0, 'completed': 1}
+
+    assert technician_orders(ObjectId()) == []
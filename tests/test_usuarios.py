@@ -0,0 +1,13 @@
+from app import extensions
+
+
+def test_list_tecnicos(client, login):
+    login('administrador')
+    extensions.db.users.insert_one({
+        'name': 'Pedro Pérez', 'role': 'tecnico', 'is_active': True, 'cedula': 'V123',
+        'especialidad': 'Frenos',
+    })
+    rv = client.get('/usuarios/list/tecnicos')
+    assert rv.status_code == 200
+    assert 'Pedro Pérez'.encode('utf-8') in rv.data
+    assert b'Frenos' in rv.data
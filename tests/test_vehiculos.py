@@ -0,0 +1,29 @@
+from bson import ObjectId
+
+from app import extensions
+from app.services.indexes import ensure_indexes
+
+
+def test_new_vehicle_with_registered_plate_key(client, login):
+    ensure_indexes()
+    login('administrador')
+    extensions.db.vehicles.insert_one({'plate': 'ABC-123', 'plate_key': 'ABC123', 'is_active': True})
+
+    rv = client.post('/vehiculos/nuevo', data={'plate': 'abc123', 'client_id': str(ObjectId())})
+    assert rv.status_code == 302
+    assert rv.headers['Location'].endswith('/vehiculos/nuevo')
+    assert extensions.db.vehicles.count_documents({}) == 1
+    with client.session_transaction() as session:
+        assert ('danger', 'Placa ya registrada') in session['_flashes']
+
+
+def test_edit_vehicle_to_registered_plate_key(client, login):
+    ensure_indexes()
+    login('supervisor')
+    extensions.db.vehicles.insert_one({'plate': 'ABC-123', 'plate_key': 'ABC123', 'is_active': True})
+    other = extensions.db.vehicles.insert_one({'plate': 'XYZ-9', 'plate_key': 'XYZ9', 'is_active': True}).inserted_id
+
+    rv = client.post(f'/vehiculos/editar/{other}', data={'plate': 'abc 123'})
+    assert rv.status_code == 302
+    assert f'/vehiculos/editar/{other}' in rv.headers['Location']
+    assert extensions.db.vehicles.find_one({'_id': other})['plate'] == 'XYZ-9'